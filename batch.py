@@ -0,0 +1,415 @@
+import random
+import numpy as np
+from onuw import (resolve_night, wake_schedule, marks, role_ids, evil_mask, suspicious_mask,
+                  seen_as_wolves_mask)
+
+"""
+Resolves many nights of the same setup at once, as numpy arrays.
+
+Each game is a row of card ids. Card c is the c-th role in the setup, and card N+3
+is the wolf-card, so layout[:, :N] are the players, layout[:, N:N+3] the center and
+layout[:, N+3] the wolf-card. Every role wakes in the same order as in resolve_night,
+and makes the same random choices, but for all games at once.
+
+Only the physical state of the night is tracked (cards, shields, reveals, marks, what
+the PI, medium and doppelganger copied, and what each player did to which locations),
+not the messages. A doppelganger copies
+a role per game, and then does that role's action in the games where it copied it, as
+do_doppelganger does. Setups with more than one doppelganger are resolved one game at a
+time with resolve_night, since a doppelganger can copy another doppelganger.
+"""
+
+#which of an array of role ids are in the group of roles given by mask (e.g. onuw.evil_mask)
+def in_category(ids, mask):
+    return (np.left_shift(1, ids, dtype=np.int64) & mask) != 0
+
+#the outcome of a batch of nights, see the module docstring for the layout of the arrays
+class BatchResult():
+    def __init__(self, players, cards, initial, layout, shielded, revealed, marked, copied,
+                 action, targets, doppelganged):
+        self.players = players
+        self.cards = cards #role name of each card id
+        self.card_roles = np.array([role_ids[name] for name in cards])
+        self.initial = initial
+        self.layout = layout
+        self.shielded = shielded
+        self.revealed = revealed
+        self.marked = marked #index into onuw.marks, or -1
+        self.copied = copied #role id copied by each card (PI, medium, doppelganger), or -1
+        self.action = action #role id whose action each player did, or -1, see _target_events
+        self.targets = targets #up to two locations each player's action was done to, or -1
+        self.doppelganged = doppelganged #the player each doppelganger copied, or -1
+
+    def __len__(self):
+        return len(self.layout)
+
+    @property
+    def final(self):
+        return self.layout[:, :-1]
+
+    @property
+    def wolf_card(self):
+        return self.layout[:, -1]
+
+    def initial_roles(self):
+        return self.card_roles[self.initial]
+
+    def final_roles(self):
+        return self.card_roles[self.final]
+
+def simulate_batch(players, roles, games, lonewolf=True, rng=None):
+    rng = np.random.default_rng(rng)
+    if roles.count("doppelganger") > 1:
+        return simulate_sequential(players, roles, games, lonewolf, rng)
+    N = len(players)
+    assert len(roles) == N + 3
+    cards = list(roles) + ["werewolf"]
+    card_roles = np.array([role_ids[name] for name in cards])
+    M = N + 3
+    layout = np.empty((games, M + 1), dtype=np.int16)
+    layout[:, :M] = np.argsort(rng.random((games, M)), axis=1)
+    layout[:, M] = M
+    initial = layout[:, :M].copy()
+    night = _BatchNight(N, card_roles, layout, rng)
+    for role_name in wake_schedule(roles):
+        copies = roles.count(role_name)
+        action = _actions.get(role_name)
+        if copies == 0 or action is None:
+            continue
+        #copies of a role act in a random order, like the shuffle in wake_role
+        is_actor = card_roles[initial[:, :N]] == role_ids[role_name]
+        keys = np.where(is_actor, rng.random(is_actor.shape), np.inf)
+        order = np.argsort(keys, axis=1)[:, :copies]
+        acting = np.take_along_axis(keys, order, axis=1) < np.inf
+        for k in range(copies):
+            action(night, order[:, k], acting[:, k], initial, night.nobody)
+        if role_name in _deferred:
+            for i, copied in night.wrapup:
+                action(night, i, copied == role_ids[role_name], initial, night.nobody)
+    return BatchResult(players, cards, initial, layout, night.shielded, night.revealed,
+                       night.marked, night.copied, night.action, night.targets,
+                       night.doppelganged)
+
+#resolve games one at a time, and pack them into the same arrays as simulate_batch
+def simulate_sequential(players, roles, games, lonewolf=True, rng=None):
+    rng = np.random.default_rng(rng)
+    py_rng = random.Random(int(rng.integers(2**63)))
+    N = len(players)
+    M = N + 3
+    cards = list(roles) + ["werewolf"]
+    initial = np.empty((games, M), dtype=np.int16)
+    layout = np.empty((games, M + 1), dtype=np.int16)
+    shielded = np.zeros((games, N), dtype=bool)
+    revealed = np.zeros((games, N), dtype=bool)
+    marked = np.full((games, N), -1, dtype=np.int8)
+    copied = np.full((games, M + 1), -1, dtype=np.int16)
+    action = np.full((games, N), -1, dtype=np.int16)
+    targets = np.full((games, N, 2), -1, dtype=np.int16)
+    doppelganged = np.full((games, N), -1, dtype=np.int16)
+    for g in range(games):
+        night = resolve_night(players, roles, lonewolf, rng=py_rng)
+        unused = {}
+        for c, name in enumerate(roles):
+            unused.setdefault(name, []).append(c)
+        card_of = {}
+        for p, role in enumerate(night.initial_roles):
+            card_of[id(role)] = unused[role.name].pop(0)
+            initial[g, p] = card_of[id(role)]
+        #the only card that wasn't dealt is the original wolf-card
+        for role in night.roles + [night.wolf_card]:
+            card_of.setdefault(id(role), M)
+        layout[g, :M] = [card_of[id(role)] for role in night.roles]
+        layout[g, M] = card_of[id(night.wolf_card)]
+        for card in night.initial_roles:
+            #a doppelganger who copied the PI counts as whatever the PI became
+            role = card
+            while role.copied is not None:
+                role = role.copied
+            if role is not card:
+                copied[g, card_of[id(card)]] = role_ids[role.name]
+        shielded[g, night.shielded] = True
+        revealed[g, night.revealed] = True
+        for j, mark in night.marked.items():
+            marked[g, j] = marks.index(mark)
+        #a doppelganger does the action of the role they copied
+        acting_as = []
+        for role in night.initial_roles:
+            while role.name == "doppelganger" and role.copied is not None:
+                role = role.copied
+            acting_as.append(role.name)
+        done = [0] * N
+        for event in night.events:
+            i = event.actor
+            if i is None:
+                continue
+            if event.action == "copy" and doppelganged[g, i] < 0:
+                doppelganged[g, i] = event.targets[0]
+            if event.action in _target_events.get(acting_as[i], ()):
+                action[g, i] = role_ids[acting_as[i]]
+                for target in event.targets[:2 - done[i]]:
+                    targets[g, i, done[i]] = target
+                    done[i] += 1
+    return BatchResult(players, cards, initial, layout, shielded, revealed, marked, copied,
+                       action, targets, doppelganged)
+
+class _BatchNight():
+    def __init__(self, N, card_roles, layout, rng):
+        games = len(layout)
+        self.N = N
+        self.card_roles = card_roles
+        self.layout = layout
+        self.rng = rng
+        self.rows = np.arange(games)
+        self.seats = np.arange(N)
+        self.shielded = np.zeros((games, N), dtype=bool)
+        self.revealed = np.zeros((games, N), dtype=bool)
+        self.marked = np.full((games, N), -1, dtype=np.int8)
+        self.copied = np.full(layout.shape, -1, dtype=np.int16)
+        self.action = np.full((games, N), -1, dtype=np.int16)
+        self.targets = np.full((games, N, 2), -1, dtype=np.int16)
+        self.doppelganged = np.full((games, N), -1, dtype=np.int16)
+        self.acting_as = card_roles[layout[:, :N]] #the role whose action each player does
+        self.nobody = np.full(games, -1)
+        self.wrapup = [] #(seats, role ids copied) of doppelgangers who act at the end of a turn
+
+    def roles_at(self, locations):
+        return self.card_roles[self.layout[self.rows, locations]]
+
+    def others(self, i):
+        return self.seats[None, :] != i[:, None]
+
+    #the seat j in each game, as a mask like others (nowhere where j is -1)
+    def seat_is(self, j):
+        return self.seats[None, :] == j[:, None]
+
+    def coin(self, p):
+        return self.rng.random(len(self.rows)) < p
+
+    def center(self):
+        return self.rng.integers(3, size=len(self.rows))
+
+    #vectorized random_choice(N, exclude): a uniformly random allowed seat in each game,
+    #and whether there was one
+    def choose(self, allowed):
+        counts = allowed.sum(axis=1)
+        r = (self.rng.random(len(counts)) * counts).astype(np.int64)
+        choice = np.argmax(np.cumsum(allowed, axis=1) > r[:, None], axis=1)
+        return choice, counts > 0
+
+    #records that player i did their action to targets (arrays of locations), in the games in sel
+    def record(self, sel, i, *targets):
+        rows, i = self.rows[sel], i[sel]
+        self.action[rows, i] = self.acting_as[rows, i]
+        for k, target in enumerate(targets):
+            self.targets[rows, i, k] = target[sel]
+
+    #vectorized rotate(roles, locations) for the games in sel
+    def rotate(self, sel, *locations):
+        rows = self.rows[sel]
+        locations = [loc[sel] for loc in locations]
+        values = [self.layout[rows, loc] for loc in locations]
+        for loc, value in zip(locations, [values[-1]] + values[:-1]):
+            self.layout[rows, loc] = value
+
+def _sentinel(night, i, acting, initial, doppelganged):
+    j, ok = night.choose(night.others(i) & ~night.shielded)
+    sel = acting & ok
+    night.shielded[night.rows[sel], j[sel]] = True
+    night.record(sel, i, j)
+
+def _doppelganger(night, i, acting, initial, doppelganged):
+    j, ok = night.choose(night.others(i) & ~night.shielded)
+    copying = acting & ok
+    copied = np.where(copying, night.roles_at(j), -1)
+    card = initial[night.rows, i]
+    night.copied[night.rows[copying], card[copying]] = copied[copying]
+    rows = night.rows[copying]
+    night.doppelganged[rows, i[copying]] = j[copying]
+    night.acting_as[rows, i[copying]] = copied[copying]
+    for name, action in _actions.items():
+        sel = copied == role_ids[name]
+        if name not in _deferred and action is not _god and sel.any():
+            action(night, i, sel, initial, np.where(copying, j, -1))
+    night.wrapup.append((i, copied))
+
+def _alphawolf(night, i, acting, initial, doppelganged):
+    N = night.N
+    #a doppelganger also counts as what they copied, see add_player_role
+    believed = night.card_roles[initial[:, :N]]
+    copied = np.take_along_axis(night.copied, initial[:, :N], axis=1)
+    wolves = (in_category(believed, seen_as_wolves_mask)
+              | in_category(np.where(copied >= 0, copied, believed), seen_as_wolves_mask))
+    allowed = night.others(i) & ~night.shielded
+    #like try_for_nonwolf, a doppelganger avoids whoever they copied instead
+    preferred = np.where((doppelganged >= 0)[:, None], allowed & ~night.seat_is(doppelganged),
+                         allowed & ~wolves)
+    j, ok = night.choose(np.where(preferred.any(axis=1)[:, None], preferred, allowed))
+    night.rotate(acting & ok, j, np.full_like(j, N + 3))
+    night.record(acting & ok, i, j)
+
+def _PI(night, i, acting, initial, doppelganged):
+    looked = ~night.others(i) | night.shielded | night.seat_is(doppelganged)
+    looking = acting.copy()
+    card = initial[night.rows, i]
+    seen = []
+    for _ in range(2):
+        j, ok = night.choose(~looked)
+        seen.append(np.where(looking & ok, j, -1))
+        saw = night.roles_at(j)
+        looked[night.rows, j] |= ok
+        became = looking & ok & in_category(saw, suspicious_mask)
+        night.copied[night.rows[became], card[became]] = saw[became]
+        looking &= ~(ok & (became | night.coin(0.5)))
+    night.record(acting & (seen[0] >= 0), i, *seen)
+
+def _medium(night, i, acting, initial, doppelganged):
+    looking = acting.copy()
+    card = initial[night.rows, i]
+    seen = []
+    for _ in range(2):
+        location = night.N + night.center()
+        seen.append(np.where(looking, location, -1))
+        saw = night.roles_at(location)
+        became = looking & in_category(saw, suspicious_mask)
+        night.copied[night.rows[became], card[became]] = saw[became]
+        looking &= ~(became | night.coin(0.5))
+    night.record(acting, i, *seen)
+
+#a doppelganger robs whoever they copied if there is nobody else, see target_options
+def _rob_target(night, i, doppelganged):
+    j, ok = night.choose(night.others(i) & ~night.shielded & ~night.seat_is(doppelganged))
+    return np.where(ok, j, doppelganged), ok | (doppelganged >= 0)
+
+def _robber(night, i, acting, initial, doppelganged):
+    free = ~night.shielded[night.rows, i]
+    j, ok = _rob_target(night, i, doppelganged)
+    night.rotate(acting & free & ok, i, j)
+    night.record(acting & free & ok, i, j)
+
+def _bandit(night, i, acting, initial, doppelganged):
+    free = ~night.shielded[night.rows, i]
+    j, ok = _rob_target(night, i, doppelganged)
+    k = night.N + night.center()
+    night.rotate(acting & free & ok, j, i, k)
+    night.record(acting & free & ok, i, j, k)
+
+def _witch(night, i, acting, initial, doppelganged):
+    N = night.N
+    j = night.center()
+    takes_evil = (in_category(night.roles_at(N + j), evil_mask) & night.coin(0.5)
+                  & ~night.shielded[night.rows, i])
+    other, ok = night.choose(night.others(i) & ~night.shielded & ~night.seat_is(doppelganged))
+    #with nobody else to give it to, a doppelganger gives it to themselves or whoever they copied
+    fallback = np.where((doppelganged >= 0) & night.coin(0.5), doppelganged, i)
+    target = np.where(takes_evil, i, np.where(ok, other, fallback))
+    #matches rotate(roles, [target, N+j-1]) in onuw.py
+    night.rotate(acting, target, N + j - 1)
+    night.record(acting, i, N + j, target)
+
+def _trickster(night, i, acting, initial, doppelganged):
+    j, ok = night.choose(night.others(i) & ~night.shielded)
+    k = night.N + night.center()
+    night.rotate(acting & ok, j, k)
+    night.record(acting & ok, i, j, k)
+
+def _troublemaker(night, i, acting, initial, doppelganged):
+    allowed = night.others(i) & ~night.shielded
+    j, ok_j = night.choose(allowed)
+    k, ok_k = night.choose(allowed & (night.seats[None, :] != j[:, None]))
+    night.rotate(acting & ok_j & ok_k, j, k)
+    night.record(acting & ok_j & ok_k, i, j, k)
+
+def _villageidiot(night, i, acting, initial, doppelganged):
+    N = night.N
+    allowed = night.others(i) & ~night.shielded
+    backwards = night.coin(0.5)
+    skip = night.coin(0.2) | (allowed.sum(axis=1) < 2)
+    #going forwards, each seat gets the card of the previous allowed seat, wrapping around
+    last = np.maximum.accumulate(np.where(allowed, night.seats, -1), axis=1)
+    previous = np.concatenate([np.full((len(last), 1), -1), last[:, :-1]], axis=1)
+    previous = np.where(previous < 0, last[:, -1:], previous)
+    #going backwards, each seat gets the card of the next allowed seat, wrapping around
+    first = np.minimum.accumulate(np.where(allowed, night.seats, N)[:, ::-1], axis=1)[:, ::-1]
+    following = np.concatenate([first[:, 1:], np.full((len(first), 1), N)], axis=1)
+    following = np.where(following >= N, first[:, :1], following)
+    source = np.clip(np.where(backwards[:, None], following, previous), 0, N - 1)
+    players = night.layout[:, :N]
+    rotated = np.where(allowed, np.take_along_axis(players, source, axis=1), players)
+    sel = acting & ~skip
+    night.layout[sel, :N] = rotated[sel]
+    #the targets are the first two players in the order they were rotated in, as in the message
+    first_two = np.argsort(~allowed, axis=1, kind="stable")[:, :2]
+    last_two = N - 1 - np.argsort(~allowed[:, ::-1], axis=1, kind="stable")[:, :2]
+    order = np.where(backwards[:, None], last_two, first_two)
+    night.record(sel, i, order[:, 0], order[:, 1])
+
+def _drunk(night, i, acting, initial, doppelganged):
+    free = ~night.shielded[night.rows, i]
+    k = night.N + night.center()
+    night.rotate(acting & free, i, k)
+    night.record(acting & free, i, k)
+
+def _revealer(night, i, acting, initial, doppelganged):
+    j, ok = night.choose(night.others(i) & ~night.shielded & ~night.revealed)
+    sel = acting & ok & ~in_category(night.roles_at(j), suspicious_mask)
+    night.revealed[night.rows[sel], j[sel]] = True
+    night.record(acting & ok, i, j)
+
+def _curator(night, i, acting, initial, doppelganged):
+    j, ok = night.choose(night.others(i) & ~night.shielded & (night.marked < 0))
+    mark = night.rng.integers(len(marks), size=len(j))
+    sel = acting & ok
+    night.marked[night.rows[sel], j[sel]] = mark[sel]
+    night.record(sel, i, j)
+
+def _god(night, i, acting, initial, doppelganged):
+    card = initial[night.rows, i]
+    location = np.argmax(night.layout == card[:, None], axis=1)
+    night.rotate(acting & (location != i), location, i)
+    night.record(acting & (location != i), i, location)
+
+#a doppelganger who copies one of these does it at the end of that role's turn, see wake_role
+#(so does one who copies the insomniac, god or enemy of reason. The god and enemy of reason
+#take back the copy, which is never on the table, so they don't do anything)
+_deferred = {"curator", "revealer"}
+
+#the events that are a role's action in resolve_night, for simulate_sequential to fill in
+#BatchResult.action and targets. The first two targets of the events are the action's targets
+_target_events = {
+    "sentinel": {"shield"},
+    "alphawolf": {"convert"},
+    "PI": {"look"},
+    "medium": {"look"},
+    "robber": {"rob"},
+    "bandit": {"rob.bandit"},
+    "witch": {"look", "give"},
+    "trickster": {"trick"},
+    "troublemaker": {"switch"},
+    "villageidiot": {"rotate"},
+    "fool": {"take"},
+    "drunk": {"take"},
+    "revealer": {"reveal", "reveal.suspicious"},
+    "curator": {"mark"},
+    "enemyofreason": {"take_back"},
+    "god": {"take_back"},
+}
+
+_actions = {
+    "sentinel": _sentinel,
+    "doppelganger": _doppelganger,
+    "alphawolf": _alphawolf,
+    "PI": _PI,
+    "medium": _medium,
+    "robber": _robber,
+    "bandit": _bandit,
+    "witch": _witch,
+    "trickster": _trickster,
+    "troublemaker": _troublemaker,
+    "villageidiot": _villageidiot,
+    "fool": _drunk,
+    "drunk": _drunk,
+    "revealer": _revealer,
+    "curator": _curator,
+    "enemyofreason": _god,
+    "god": _god,
+}
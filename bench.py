@@ -0,0 +1,250 @@
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import onuw
+from onuw import GameState, role_handlers, random_choice, rotate, target_options
+
+"""
+Usage: `python bench.py [--save baseline.json] [--compare baseline.json] [--only name]`
+
+Times the parts of the code that matter for speed:
+
+    * role.<name>: one role's action, on a night that is ready for it to wake
+    * helper.<name>: targeting and bookkeeping helpers used by every action
+    * night.<setup>: whole nights, for tables of 3 to 100 players and role-heavy setups
+    * batch.<setup>: nights per second of batch.simulate_batch, if numpy is installed
+    * slack.<name>: message delivery against a local mock of the slack api
+
+Each result is the best time per operation over a few repeats. --save writes them to a
+JSON baseline, and --compare flags every benchmark that got slower than the baseline by
+more than --threshold (and exits with status 1 if any did).
+"""
+
+benchmarks = {}
+
+#registers a benchmark. f() does any setup, and returns (run, n) or (run, n, prepare),
+#where run() does n operations. Only run() is timed, and prepare() is called before each run
+def bench(name):
+    def register(f):
+        benchmarks[name] = f
+        return f
+    return register
+
+#best seconds per operation of run, over repeats of enough calls to take min_time
+#(or max_time including prepare, when preparing is much slower than running)
+def measure(run, n, prepare=None, repeats=5, min_time=0.2, max_time=2.0):
+    def timed(calls):
+        elapsed = 0
+        for _ in range(calls):
+            if prepare is not None:
+                prepare()
+            start = time.perf_counter()
+            run()
+            elapsed += time.perf_counter() - start
+        return elapsed
+    #one call to see how long calls take, then enough calls for each repeat
+    start = time.perf_counter()
+    elapsed = timed(1)
+    wall = time.perf_counter() - start
+    calls = max(1, int(min(min_time / elapsed, max_time / wall) / repeats))
+    best = min(timed(calls) for _ in range(repeats))
+    return best / (calls * n)
+
+def players_for(N):
+    return [f"p{i}" for i in range(N)]
+
+#a setup with N players where roles are taken from base in turn
+def setup(base, N):
+    return [base[k % len(base)] for k in range(N + 3)]
+
+mixed = ["werewolf", "seer", "robber", "troublemaker", "villager", "minion", "drunk", "insomniac",
+         "alphawolf", "mysticwolf", "sentinel", "curator", "revealer", "PI", "villageidiot",
+         "witch", "mason", "mason", "doppelganger", "tanner"]
+
+#roles that can't act alone need someone to look at or swap with
+role_filler = ["werewolf", "villager", "seer", "robber", "troublemaker", "minion", "tanner", "mason"]
+
+def role_bench(name):
+    def f():
+        N = 8
+        roles = [name] + setup(role_filler, N - 1)
+        states = []
+        for k in range(200):
+            state = GameState(players_for(N), roles, rng=random.Random(k), shuffle=False)
+            state.begin_night()
+            states.append(state)
+        forks = []
+        def prepare():
+            forks[:] = [state.fork() for state in states]
+        def run():
+            for state in forks:
+                state.do_role(0, state.initial_roles[0])
+        return run, len(states), prepare
+    return f
+
+for name in sorted(role_handlers):
+    bench(f"role.{name}")(role_bench(name))
+
+@bench("helper.random_choice")
+def bench_random_choice():
+    rng = random.Random(0)
+    excludes = [[0], [3, 4], [7]]
+    return (lambda: [random_choice(20, *excludes, rng=rng) for _ in range(1000)]), 1000
+
+@bench("helper.target_options")
+def bench_target_options():
+    excludes = [[0], [3, 4], [7]]
+    return (lambda: [target_options(20, *excludes) for _ in range(1000)]), 1000
+
+@bench("helper.rotate")
+def bench_rotate():
+    xs = list(range(100))
+    locations = list(range(0, 100, 3))
+    return (lambda: [rotate(xs, locations) for _ in range(1000)]), 1000
+
+@bench("helper.players_in_category")
+def bench_players_in_category():
+    state = GameState(players_for(100), setup(mixed, 100), rng=random.Random(0))
+    cats = [onuw.awake_wolves, onuw.seen_as_wolves, onuw.see_wolves, onuw.lovers]
+    def run():
+        for k in range(250):
+            for cat in cats:
+                state.players_in_category(cat)
+            state.add_player_role(k % 100, "werewolf")
+    return run, 1000
+
+@bench("helper.fork")
+def bench_fork():
+    state = GameState(players_for(20), setup(mixed, 20), rng=random.Random(0))
+    state.begin_night()
+    return (lambda: [state.fork() for _ in range(100)]), 100
+
+def night_bench(base, N):
+    def f():
+        players = players_for(N)
+        roles = setup(base, N)
+        rng = random.Random(0)
+        games = max(1, 2000 // N)
+        return (lambda: [onuw.resolve_night(players, roles, rng=rng) for _ in range(games)]), games
+    return f
+
+for N in [3, 5, 8, 10, 20, 50, 100]:
+    bench(f"night.mixed.{N}")(night_bench(mixed, N))
+bench("night.doppelgangers.20")(night_bench(["doppelganger", "doppelganger", "doppelganger", "werewolf", "seer",
+                                            "robber", "troublemaker", "insomniac"], 20))
+bench("night.villageidiots.20")(night_bench(["villageidiot", "villageidiot", "werewolf", "villager"], 20))
+bench("night.tricksters.20")(night_bench(["trickster", "trickster", "werewolf", "villager"], 20))
+
+#rendering every player's messages and the log of a night
+@bench("night.render.20")
+def bench_render():
+    night = onuw.resolve_night(players_for(20), setup(mixed, 20), rng=random.Random(0))
+    return (lambda: [night.messages, night.log]), 1
+
+def batch_bench(base, N):
+    def f():
+        import batch
+        players = players_for(N)
+        roles = setup(base, N)
+        games = 20000
+        return (lambda: batch.simulate_batch(players, roles, games, rng=0)), games
+    return f
+
+bench("batch.mixed.10")(batch_bench([name for name in mixed if name != "doppelganger"], 10))
+bench("batch.mixed.50")(batch_bench([name for name in mixed if name != "doppelganger"], 50))
+
+#a stand-in for the slack api, which answers every call after latency seconds
+class MockSlack(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.01
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        method = self.path.split("/")[-1]
+        if method == "conversations.open":
+            result = {"ok": True, "channel": {"id": "D" + body["users"][0]}}
+        else:
+            time.sleep(self.latency)
+            result = {"ok": True}
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def mock_slack():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSlack)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def slack_bench(messages, text):
+    def f():
+        import slack
+        server = mock_slack()
+        #only the delivery itself is measured, not slack's rate limits
+        slack.configure("127.0.0.1", server.server_address[1], https=False, token="xoxb-bench",
+                        rate_limited=False)
+        batch = [([f"U{k}"], text) for k in range(messages)]
+        return (lambda: slack.post_messages(batch)), messages
+    return f
+
+bench("slack.post_messages.short")(slack_bench(100, "p1 looked at center card 2 and saw werewolf"))
+bench("slack.post_messages.long")(slack_bench(100, "\n".join(["p1 looked at p2 and saw werewolf"] * 200)))
+
+def run_benchmarks(only=None):
+    results = {}
+    for name, f in benchmarks.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        try:
+            benchmark = f()
+        except ImportError as e:
+            print(f"{name:40} skipped ({e})")
+            continue
+        results[name] = measure(*benchmark)
+        print(f"{name:40} {format_time(results[name])}")
+    return results
+
+def format_time(seconds):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+#the benchmarks that are slower than the baseline by more than threshold, as name -> ratio
+def regressions(results, baseline, threshold):
+    return {name: t / baseline[name] for name, t in results.items()
+            if name in baseline and t > baseline[name] * (1 + threshold)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare the results to this JSON baseline")
+    parser.add_argument("--only", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--threshold", type=float, default=0.2, help="how much slower counts as a regression")
+    args = parser.parse_args()
+    results = run_benchmarks(args.only)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        slower = regressions(results, baseline, args.threshold)
+        print(f"\n{'speedup over ' + args.compare:40}")
+        for name, t in sorted(results.items()):
+            if name in baseline:
+                flag = "  REGRESSION" if name in slower else ""
+                print(f"{name:40} {baseline[name] / t:6.2f}x{flag}")
+        if slower:
+            sys.exit(1)
@@ -0,0 +1,121 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Ways of getting night messages and announcements to players.
+
+A backend has:
+
+    reachable(players)  the players it can deliver to
+    send(messages)      delivers a list of (player, text), all at once, and may return
+                        the seconds each message took to be delivered
+    announce(text)      delivers text to every reachable player
+
+game() sends through one backend, and passes the computer around for anyone that
+backend can't reach. Backends import what they need when they are created, so that
+e.g. slack and its token are only needed for games that use slack.
+"""
+
+def wait():
+    input()
+
+def clear():
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+#pass the computer to each player in turn, to read their messages
+class TerminalBackend():
+    def __init__(self, wait_after=True):
+        self.wait_after = wait_after #whether to wait for the player to finish reading
+        self.players = []
+
+    def reachable(self, players):
+        self.players = list(players)
+        return set(players)
+
+    def send(self, messages):
+        for player, text in messages:
+            clear()
+            print(f"pass the computer to {player}")
+            wait()
+            clear()
+            print(text)
+            if self.wait_after:
+                wait()
+
+    def announce(self, text):
+        print(text)
+
+#direct messages from a slack bot, see slack.py for setting it up
+class SlackBackend():
+    def __init__(self):
+        import slack
+        self.slack = slack
+        self.ids = {}
+
+    def reachable(self, players):
+        self.ids = self.slack.get_slack_ids(players)
+        return set(self.ids)
+
+    def send(self, messages):
+        return self.slack.post_messages([([self.ids[player]], text) for player, text in messages])
+
+    def announce(self, text):
+        self.send([(player, text) for player in self.ids])
+
+#appends each player's messages to <directory>/<player>.txt
+class FileBackend():
+    def __init__(self, directory):
+        self.directory = directory
+        self.players = []
+        os.makedirs(directory, exist_ok=True)
+
+    def reachable(self, players):
+        self.players = list(players)
+        return set(players)
+
+    def send(self, messages):
+        for player, text in messages:
+            with open(os.path.join(self.directory, f"{player}.txt"), "a") as f:
+                f.write(text + "\n\n")
+
+    def announce(self, text):
+        self.send([(player, text) for player in self.players])
+
+#POSTs {"player": ..., "text": ...} as JSON to url for each message, e.g. for a local bot
+class WebhookBackend():
+    def __init__(self, url, threads=8):
+        import urllib.request
+        self.request = urllib.request
+        self.url = url
+        self.threads = threads
+        self.players = []
+
+    def reachable(self, players):
+        self.players = list(players)
+        return set(players)
+
+    def post(self, message):
+        player, text = message
+        request = self.request.Request(self.url, json.dumps({"player": player, "text": text}).encode(),
+                                       {"Content-Type": "application/json"})
+        with self.request.urlopen(request, timeout=30) as response:
+            response.read()
+
+    def send(self, messages):
+        with ThreadPoolExecutor(self.threads) as executor:
+            list(executor.map(self.post, messages))
+
+    def announce(self, text):
+        self.send([(player, text) for player in self.players])
+
+backends = {
+    "terminal": TerminalBackend,
+    "slack": SlackBackend,
+    "file": FileBackend,
+    "webhook": WebhookBackend,
+}
+
+#e.g. get_backend("file", "messages/")
+def get_backend(name, *args):
+    return backends[name](*args)
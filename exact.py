@@ -0,0 +1,185 @@
+from collections import Counter
+from math import factorial, prod
+from onuw import GameState, wake_schedule, wake_priorities, werewolves_priority
+
+"""
+Computes the exact distribution of what can happen in a night, instead of sampling it.
+
+Every random choice in a night has fixed probabilities, so a night is a finite tree of
+choices. Each wake step is explored by replaying it on a copy of the state with a
+Script of choices, and after every step, states that will behave the same for the rest
+of the night (same cards, shields, marks, wolf-card, ...) are merged and their
+probabilities added.
+
+Every distinct deal is still explored on its own, and the answer has about one outcome
+per deal, so the cost grows with the number of deals: 2,520 for 4 players takes about
+4 seconds, and 20,160 for 5 players about a minute and 700 MB. Setups with more deals
+than max_deals (e.g. 181,440 for a typical 6 player table) are refused rather than left
+to run for many minutes.
+
+So the exact answer over all deals is only for tables of up to 5 players. States from
+different deals can't be merged, since their final roles differ, and dealing the center
+lazily (only when someone looks at it) doesn't help: the lone wolf, seer, drunk and witch
+turn most of it over, and it made a typical 4 player table twice as slow. One deal is
+cheap at any size, though: with deal given, a night of an 8 player table takes about 30ms.
+For bigger tables over all deals, batch.py is the better tool, since most of the variance
+between nights comes from the deal rather than from the choices made during the night.
+"""
+
+#the most deals exact_night will explore, unless it is told otherwise
+max_deals = 50000
+
+#a policy that makes the choices in path, then the first option of every later choice,
+#and records how many options each choice had
+class Script():
+    def __init__(self, path=()):
+        self.path = path
+        self.taken = []
+        self.options = []
+        self.prob = 1.0
+
+    def pick(self, n, probs=None):
+        k = len(self.taken)
+        choice = self.path[k] if k < len(self.path) else 0
+        self.taken.append(choice)
+        self.options.append(n)
+        self.prob *= probs[choice] if probs else 1 / n
+        return choice
+
+    def choose(self, state, point, i, options):
+        if len(options) == 1:
+            return options[0]
+        return options[self.pick(len(options))]
+
+    def chance(self, state, point, i, p):
+        return self.pick(2, (p, 1 - p)) == 0
+
+    def order(self, state, point, i, xs):
+        rest = list(xs)
+        for k in range(len(xs)):
+            xs[k] = rest.pop(self.pick(len(rest)) if len(rest) > 1 else 0)
+
+#every way a step can go from this state, as (state after the step, probability)
+#if given, policy(script) is used instead of the script itself, e.g. so that only some
+#players' decisions are enumerated and the rest are made at random
+def step_outcomes(state, step, policy=None):
+    paths = [[]]
+    while paths:
+        path = paths.pop()
+        script = Script(path)
+        fork = state.fork()
+        fork.policy = script if policy is None else policy(script)
+        fork.do_step(step)
+        #every choice made after the end of path could have gone another way
+        for k in range(len(path), len(script.taken)):
+            for alternative in range(1, script.options[k]):
+                paths.append(script.taken[:k] + [alternative])
+        yield fork, script.prob
+
+def count_deals(roles):
+    return factorial(len(roles)) // prod(factorial(c) for c in Counter(roles).values())
+
+#every distinct way to deal roles, with its probability
+def deals(roles):
+    counts = Counter(roles)
+    p = prod(factorial(c) for c in counts.values()) / factorial(len(roles))
+    def arrange(dealt):
+        if len(dealt) == len(roles):
+            yield list(dealt)
+        for name in sorted(counts):
+            if counts[name]:
+                counts[name] -= 1
+                dealt.append(name)
+                yield from arrange(dealt)
+                dealt.pop()
+                counts[name] += 1
+    for dealt in arrange([]):
+        yield dealt, p
+
+def step_priority(step):
+    return werewolves_priority if step == "werewolves" else wake_priorities[step]
+
+#everything about a state that can affect the rest of the night (after the step with
+#priority done) or its outcome, so that states with the same key can be merged
+def state_key(state, done, seats, keep_log):
+    def later(name):
+        priority = wake_priorities.get(name)
+        return priority is not None and priority > done
+    home = {id(role): p for p, role in enumerate(state.initial_roles)}
+    def card(role):
+        #god takes back their own card, so it matters which god card is where
+        if role.name in ("god", "enemyofreason") and later(role.name):
+            return (role.full_str(), home.get(id(role)))
+        return role.full_str()
+    key = (tuple(card(role) for role in state.roles),
+           card(state.wolf_card),
+           tuple(role.name if later(role.name) else None for role in state.initial_roles[:state.N]),
+           tuple((i, role.full_str()) for i, role in state.wrapup if later(role.name)),
+           tuple(sorted(state.shielded)),
+           tuple(sorted(state.revealed)),
+           tuple(sorted(state.marked.items())))
+    #wolves, masons and lovers see who currently believes they have those roles
+    if done < max(wake_priorities[name] for name in ("mysticwolf", "mason", "lovervillager")):
+        key += (tuple(sorted((name, tuple(sorted(players)))
+                             for name, players in state.players_by_role.items() if players)),)
+    if seats:
+        key += (tuple(tuple(state.messages_for(i)) for i in seats), tuple(state.wake_order))
+    if keep_log:
+        key += (tuple(state.log),)
+    return key
+
+#drop events that aren't part of the outcome, so that they don't take up memory
+def forget(state, seats, keep_log):
+    if not keep_log:
+        state.events = [event for event in state.events if any(event.seen_by(i) for i in seats)]
+
+#the exact distribution over outcomes of a night, as a Counter from outcome to probability
+#an outcome is (final roles including the center, wolf-card, marks), followed by the
+#messages of each player in seats. If deal is given, the roles are dealt in that order
+def exact_night(players, roles, lonewolf=True, deal=None, seats=(), max_deals=max_deals):
+    N = len(players)
+    assert len(roles) == N + 3
+    if deal is None and count_deals(roles) > max_deals:
+        raise ValueError(f"{count_deals(roles)} deals is too many to solve exactly "
+                         f"(max_deals={max_deals}); pass a deal, or use batch.py")
+    seats = tuple(seats)
+    #god sees the log, so their messages depend on it
+    keep_log = any(name in ("god", "enemyofreason") for name in roles) and bool(seats)
+    states = {}
+    def add(states, state, p, key):
+        if key in states:
+            states[key][1] += p
+        else:
+            states[key] = [state, p]
+    for dealt, p in ([(list(deal), 1.0)] if deal is not None else deals(roles)):
+        state = GameState(players, dealt, lonewolf, shuffle=False, policy=Script())
+        state.begin_night()
+        forget(state, seats, keep_log)
+        add(states, state, p, state_key(state, 0, seats, keep_log))
+    for step in wake_schedule(set(roles)):
+        done = step_priority(step)
+        merged = {}
+        for state, p in states.values():
+            for fork, q in step_outcomes(state, step):
+                forget(fork, seats, keep_log)
+                add(merged, fork, p * q, state_key(fork, done, seats, keep_log))
+        states = merged
+    outcomes = Counter()
+    for state, p in states.values():
+        state.end_night()
+        outcome = (tuple(role.full_str() for role in state.roles),
+                   state.wolf_card.full_str(),
+                   tuple(sorted(state.marked.items())))
+        outcome += tuple(tuple(state.messages_for(i)) for i in seats)
+        outcomes[outcome] += p
+    return outcomes
+
+#for each location (players, then center), the distribution of the role that ends up there
+def final_role_distributions(outcomes):
+    result = None
+    for (final, wolf_card, marked, *messages), p in outcomes.items():
+        if result is None:
+            result = [Counter() for _ in final]
+        for location, role in enumerate(final):
+            result[location][role] += p
+    return result
@@ -0,0 +1,154 @@
+import sys
+import json
+import time
+import random
+import sqlite3
+from onuw import resolve_night, derive_rng, replay_record
+
+"""
+Usage: `python history.py games.db player1,...,playerN role1,...,roleM [games] [seed]`
+
+An append-only SQLite store of every game that is played or simulated, so that stats
+are a query instead of a grep through logs. Running this file simulates games of one
+setup into the store.
+
+    games        one row per game: number of players, setup (sorted roles), seed,
+                 replay record, wolf-card, whether it was played or simulated
+    setup_roles  how many of each role each game had
+    seats        one row per player and center card: player name (null for the
+                 center), initial role, final role (what a copier copied, in brackets),
+                 mark, and whether they were shielded or revealed
+    events       everything that happened in the night, in order (see onuw.Event)
+
+E.g. how often the robber ends the night as a wolf, in 7 player games with an alphawolf:
+
+    history.final_role_rate("games.db", "robber", onuw.all_wolves, players=7, with_roles=["alphawolf"])
+"""
+
+schema = """
+create table if not exists games (
+    id integer primary key,
+    time real,
+    source text,
+    players integer,
+    setup text,
+    seed integer,
+    replay text,
+    wolf_card text
+);
+create table if not exists setup_roles (
+    game integer references games(id),
+    role text,
+    count integer
+);
+create table if not exists seats (
+    game integer references games(id),
+    location integer,
+    player text,
+    initial_role text,
+    final_role text,
+    final_base_role text,
+    mark text,
+    shielded integer,
+    revealed integer
+);
+create table if not exists events (
+    game integer references games(id),
+    k integer,
+    actor integer,
+    action text,
+    targets text,
+    seen text
+);
+create index if not exists games_players on games(players, setup);
+create index if not exists setup_roles_role on setup_roles(role, count, game);
+create index if not exists seats_player on seats(player);
+create index if not exists seats_roles on seats(initial_role, final_base_role, game);
+create index if not exists seats_game on seats(game);
+create index if not exists events_game on events(game, k);
+"""
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.execute("pragma journal_mode = wal")
+    db.executescript(schema)
+    return db
+
+#the role a card counts as at the end of the night, e.g. doppelganger (robber) -> robber
+def base_role(role):
+    while role.copied is not None:
+        role = role.copied
+    return role.name
+
+#adds one night to the store, without committing
+#roles is the setup in the order it was dealt from, so that the night can be replayed
+def add_game(db, night, roles, seed=None, lonewolf=True, source="play"):
+    N = len(night.players)
+    replay = replay_record(seed, night.players, roles, lonewolf) if seed is not None else None
+    #sqlite integers are signed 64 bit, so a larger seed (e.g. from seed=) is only kept in the replay
+    if seed is not None and not -2**63 <= seed < 2**63:
+        seed = None
+    game = db.execute("insert into games (time, source, players, setup, seed, replay, wolf_card) "
+                      "values (?, ?, ?, ?, ?, ?, ?)",
+                      (time.time(), source, N, ",".join(sorted(roles)), seed, replay,
+                       night.wolf_card.full_str())).lastrowid
+    counts = {}
+    for name in roles:
+        counts[name] = counts.get(name, 0) + 1
+    db.executemany("insert into setup_roles values (?, ?, ?)",
+                   [(game, name, count) for name, count in counts.items()])
+    shielded = set(night.shielded)
+    revealed = set(night.revealed)
+    db.executemany("insert into seats values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   [(game, j, night.players[j] if j < N else None, night.initial_roles[j].name,
+                     role.full_str(), base_role(role), night.marked.get(j),
+                     j in shielded, j in revealed)
+                    for j, role in enumerate(night.roles)])
+    db.executemany("insert into events values (?, ?, ?, ?, ?, ?)",
+                   [(game, k, event.actor, event.action, json.dumps(list(event.targets)),
+                     json.dumps([str(x) for x in event.seen]))
+                    for k, event in enumerate(night.events)])
+    return game
+
+def record_game(path, night, roles, seed=None, lonewolf=True, source="play"):
+    db = connect(path)
+    with db:
+        game = add_game(db, night, roles, seed, lonewolf, source)
+    db.close()
+    return game
+
+#simulates games of one setup into the store, all in one transaction
+#game k is seeded from derive_rng(seed, k), so it can be replayed from its record
+def simulate(path, players, roles, games, seed=0, lonewolf=True):
+    db = connect(path)
+    with db:
+        for k in range(games):
+            game_seed = derive_rng(seed, k).getrandbits(63)
+            night = resolve_night(players, roles, lonewolf, rng=random.Random(game_seed))
+            add_game(db, night, roles, game_seed, lonewolf, source="simulated")
+    db.close()
+
+#the fraction of players dealt initial_role who ended the night as one of final_roles,
+#optionally only for games with some number of players, or that had all of with_roles
+def final_role_rate(path, initial_role, final_roles, players=None, with_roles=()):
+    sql = ["select avg(seats.final_base_role in (%s)) from seats join games on games.id = seats.game"
+           " where seats.player is not null and seats.initial_role = ?" % ",".join("?" * len(final_roles))]
+    params = list(final_roles) + [initial_role]
+    if players is not None:
+        sql.append("and games.players = ?")
+        params.append(players)
+    for name in with_roles:
+        sql.append("and seats.game in (select game from setup_roles where role = ?)")
+        params.append(name)
+    db = connect(path)
+    (rate,), = db.execute(" ".join(sql), params).fetchall()
+    db.close()
+    return rate
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    players = sys.argv[2].split(",")
+    roles = sys.argv[3].split(",")
+    games = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    simulate(path, players, roles, games, seed)
@@ -1,11 +1,12 @@
 import random
-import os
 import sys
 import json
 import time
-from collections import defaultdict
+import hashlib
+from collections import defaultdict, Counter
+from functools import lru_cache
 from copy import copy
-from slack import post_message, get_slack_ids
+from delivery import get_backend, TerminalBackend, wait, clear
 
 valid_roles = {"villager", "minion", "werewolf", "doppelganger", "troublemaker",
                "robber", "bandit", "seer", "mason", "hunter", "bodyguard", "tanner",
@@ -23,7 +24,28 @@ seen_as_wolves = all_wolves + ("imposter",)
 see_wolves = awake_wolves + ("minion", "merlin")
 evil = all_wolves + ("minion",)
 suspicious = evil + ("tanner", "lovervillager", "god", "enemyofreason")
-lovers = ("lovervillager", "loverwerewolf")
+lovers = ("lovervillager", "loverwolf")
+
+#each role has a small integer id, and each group of roles a bitmask of those ids,
+#so that checking whether a role is in a group is a single &
+role_names = sorted(valid_roles)
+role_ids = {name: k for k, name in enumerate(role_names)}
+
+def role_mask(cat):
+    assert all(name in role_ids for name in cat), cat
+    return sum(1 << role_ids[name] for name in set(cat))
+
+all_wolves_mask = role_mask(all_wolves)
+seen_as_wolves_mask = role_mask(seen_as_wolves)
+evil_mask = role_mask(evil)
+suspicious_mask = role_mask(suspicious)
+
+_category_masks = {}
+
+def category_mask(cat):
+    if cat not in _category_masks:
+        _category_masks[cat] = role_mask(cat)
+    return _category_masks[cat]
 
 #defining marks for curator
 marks = ("mark of villager", "mark of werewolf", "mark of tanner",
@@ -51,9 +73,13 @@ All roles are randomized. This has a few material changes:
 #represents a physical card
 #use this instead of strings because Doppelganger and PI cards have state
 class Role():
+    __slots__ = ("name", "id", "bit", "copied")
+
     def __init__(self, name):
-        self.name = name
         assert name in valid_roles, name
+        self.name = name
+        self.id = role_ids[name]
+        self.bit = 1 << self.id
         self.copied = None
 
     def __str__(self):
@@ -65,436 +91,801 @@ class Role():
             result = f"{result} ({self.copied.full_str()})"
         return result
 
-def game(players, roles, lonewolf=True, use_slack=False):
+#one thing that happened during the night, e.g. actor "look"ed at targets and saw seen
+#targets are locations: players, then the center (N+k), then the wolf-card (N+3)
+#audience is the players who see it, or None if everyone does
+#the text is only rendered when someone asks for it, see event_text
+class Event():
+    __slots__ = ("audience", "action", "actor", "targets", "seen")
+
+    def __init__(self, audience, action, actor, targets, seen):
+        self.audience = audience
+        self.action = action
+        self.actor = actor
+        self.targets = targets
+        self.seen = seen
+
+    def seen_by(self, i):
+        return self.audience is None or i in self.audience
+
+#action -> (what the audience sees, what goes in the log), or one text for both
+#a log text of None means the event isn't logged
+#texts are either format strings, or functions of (players, event)
+#what the audience sees can also be a dict from "actor", "target" or None (everyone else)
+#to text, so that one event is stored for everyone when only a few players see it differently
+event_text = {
+    "seating": (lambda players, e: f"--------------------\nSeating order: {', '.join(players)}\n", None),
+    "begin": "{actor} began the night as {seen}",
+    "shield": ("{target} was marked with a shield", "{actor} marked {target} with a shield"),
+    "look": "{actor} looked at {target} and saw {seen}",
+    "look.none": "{actor} had no one to look at",
+    "look.nobody": "{actor} looked at no one",
+    "hallucinate": ("{actor} looked at {target} and saw {seen}",
+                    "{actor} looked at {target} and hallucinated {seen}"),
+    "become": "{actor} became {seen}",
+    "give": "{actor} gave {target} role {seen}",
+    "mark": ({"actor": "{actor} gave {target} a mark", "target": "{target} received {seen}",
+              None: "{target} received a mark"},
+             "{actor} gave {target} {seen}"),
+    "mark.none": "{actor} had no one to mark",
+    "shielded": "{actor} did nothing, because they were shielded",
+    "take": ("{actor} took {target}", "{actor} took {target} which was {seen}"),
+    "rotate": "{actor} rotated {path}",
+    "rotate.none": "{actor} didn't rotate anyone",
+    "reveal": ("{target} was revealed to be {seen}", "{actor} revealed {target} to be {seen}"),
+    "reveal.suspicious": "{actor} looked at {target} and saw {seen}, so did not reveal",
+    "reveal.none": "{actor} had no one to reveal",
+    "copy": "{actor} doppelganged {target}, who was {seen}",
+    "copy.none": "{actor} had no one to copy",
+    "rob": "{actor} stole {seen} from {target}",
+    "rob.bandit": ("{actor} stole {seen} from {target} and gave them {target2}",
+                   "{actor} stole {seen} from {target} and gave them {target2} which was {seen2}"),
+    "rob.none": "{actor} couldn't rob anyone",
+    "convert": ("{actor} turned {target} into a wolf",
+                "{actor} exchanged {target} with the wolf-card, which was {seen}"),
+    "convert.none": "{actor} turned no one into a wolf",
+    "insomniac": ("{actor} ended the night as {seen}", None),
+    "insomniac.shielded": "{actor} did not see their role, because they were shielded",
+    "group": (lambda players, e: reveal_msg(*e.seen, players, e.targets), None),
+    "take_back": "{actor} took their original role back from {target}",
+    "switch": "{actor} switched {target} and {target2}",
+    "switch.none": "{actor} couldn't switch anybody",
+    "trick": ("{actor} gave the player with role {seen} the new role {seen2}",
+              "{actor} gave {target} {target2} which was {seen2}"),
+    "wake_order": ("{seen}", None),
+}
+
+def location_str(players, location):
     N = len(players)
-    assert len(roles) == N + 3
-    roles = [Role(role) for role in roles]
-    random.shuffle(roles)
-    initial_roles = copy(roles)
-    slack_ids = get_slack_ids(players) if use_slack else {}
-
-    log = [] #log that will be viewed at end of game
-    messages = [[] for _ in range(N)] #messages that will be seen by player i
-    players_by_role = defaultdict(list) #which players currently believe they are role X
-    initial_players_by_role = defaultdict(list) #which players initially believe they are role X
-    for i in range(N):
-        players_by_role[roles[i].name].append(i)
-        initial_players_by_role[roles[i].name].append(i)
-
-    #list of (player, role) actions that need to be performed later
-    #(e.g. when doppelganger copies an insomniac, revealer, or god)
-    wrapup = []
-
-    shielded = []
-    revealed = []
-    marked = {}
-
-    def players_in_category(cat):
-        return [player for role in cat for player in players_by_role[role]]
-
-    def message_and_log(i, during, after=None):
-        messages[i].append(f"{players[i]} {during}")
-        log.append(f"{players[i]} {after or during}")
-
-    def broadcast_and_log(during, after=None):
+    if location < N:
+        return players[location]
+    if location < N + 3:
+        return f"center card {location-N+1}"
+    return "the wolf-card"
+
+def render(players, event, text):
+    if callable(text):
+        return text(players, event)
+    names = [location_str(players, j) for j in event.targets]
+    seen = [str(x) for x in event.seen]
+    return text.format(actor=players[event.actor] if event.actor is not None else None,
+                       target=names[0] if names else None,
+                       target2=names[1] if len(names) > 1 else None,
+                       path=' -> '.join(names),
+                       seen=seen[0] if seen else None,
+                       seen2=seen[1] if len(seen) > 1 else None)
+
+#the messages player i saw, rendered from the night's events
+def render_messages(players, events, i):
+    result = []
+    for k, event in enumerate(events):
+        if not event.seen_by(i):
+            continue
+        if event.action == "god":
+            #god sees the log of everything before them
+            result.extend(f"[{event.seen[0]}] {m}" for m in render_log(players, events, k))
+            continue
+        text = event_text[event.action]
+        if isinstance(text, tuple):
+            text = text[0]
+        if isinstance(text, dict):
+            text = text["actor" if i == event.actor else "target" if i in event.targets else None]
+        result.append(render(players, event, text))
+    return result
+
+#the log of the first stop events (all of them by default)
+def render_log(players, events, stop=None):
+    result = []
+    for k in range(len(events) if stop is None else stop):
+        event = events[k]
+        text = event_text.get(event.action)
+        after = text[1] if isinstance(text, tuple) else text
+        if after is not None:
+            result.append(render(players, event, after))
+    return result
+
+#everything that happened during one night, as returned by resolve_night
+#messages and log are rendered from events whenever they are asked for
+class NightResult():
+    def __init__(self, players, initial_roles, roles, wolf_card, shielded, revealed,
+                 marked, wake_order, wake_order_str, events):
+        self.players = players
+        self.initial_roles = initial_roles #roles dealt to players and center, in seat order
+        self.roles = roles #roles at the end of the night; the last 3 are the center
+        self.wolf_card = wolf_card
+        self.shielded = shielded
+        self.revealed = revealed
+        self.marked = marked #player -> mark
+        self.wake_order = wake_order #names of roles that were in the game, in wake order
+        self.wake_order_str = wake_order_str
+        self.events = events
+
+    #messages[i] is what player i saw
+    @property
+    def messages(self):
+        return [render_messages(self.players, self.events, i) for i in range(len(self.players))]
+
+    #full transcript
+    @property
+    def log(self):
+        return render_log(self.players, self.events)
+
+    def final_role_str(self, i):
+        result = f"{self.players[i]}: {self.roles[i].full_str()}"
+        if i in self.marked:
+            result += f" ({self.marked[i]})"
+        return result
+
+#makes every decision in a night at random, with the probabilities described above
+#a policy gets the GameState, the name of the decision (e.g. "robber.target"), and the
+#player making it, so that other policies can make decisions however they like
+class RandomPolicy():
+    def __init__(self, rng=random):
+        self.rng = rng
+
+    def choose(self, state, point, i, options):
+        return self.rng.choice(options)
+
+    def chance(self, state, point, i, p):
+        return self.rng.random() < p
+
+    def order(self, state, point, i, xs):
+        self.rng.shuffle(xs)
+
+#lets some players (e.g. AI seats) make their own decisions, given as {player: policy},
+#while everyone else uses default
+class SeatPolicy():
+    def __init__(self, policies, default):
+        self.policies = policies
+        self.default = default
+
+    def choose(self, state, point, i, options):
+        return self.policies.get(i, self.default).choose(state, point, i, options)
+
+    def chance(self, state, point, i, p):
+        return self.policies.get(i, self.default).chance(state, point, i, p)
+
+    def order(self, state, point, i, xs):
+        self.policies.get(i, self.default).order(state, point, i, xs)
+
+#role name -> the GameState method that performs its night action
+role_handlers = {}
+#role name -> when it wakes up relative to the other roles, or None if it never wakes up
+wake_priorities = {}
+#when the wolves, minion and merlin see who the wolves are
+werewolves_priority = 50
+
+#registers a GameState method as the night action of each role passed as a keyword,
+#e.g. @wakes(robber=220, bandit=230). To add a role, add it to valid_roles and register it here
+def wakes(**priorities):
+    def register(handler):
+        for name, priority in priorities.items():
+            assert name in valid_roles, name
+            role_handlers[name] = handler
+            wake_priorities[name] = priority
+        return handler
+    return register
+
+#the roles that wake up in a game with these roles, in order, where "werewolves" is
+#the step where the wolves see each other. Compiled once per setup
+def wake_schedule(roles):
+    return _wake_schedule(frozenset(roles))
+
+@lru_cache(maxsize=None)
+def _wake_schedule(roles):
+    if "alphawolf" in roles: #the alphawolf can put the wolf-card into play
+        roles = roles | {"werewolf"}
+    steps = [(wake_priorities[name], name) for name in roles if wake_priorities[name] is not None]
+    if any(name in roles for name in see_wolves):
+        steps.append((werewolves_priority, "werewolves"))
+    return tuple(name for priority, name in sorted(steps))
+
+#all the state of one night, so that separate games can be resolved side by side
+#(e.g. in threads or asyncio tasks) without sharing anything
+class GameState():
+    #if shuffle is False, roles are dealt in the order given
+    #policy makes the night's decisions, by default at random using rng
+    def __init__(self, players, roles, lonewolf=True, rng=random, shuffle=True, policy=None):
+        N = len(players)
+        assert len(roles) == N + 3
+        self.players = players
+        self.N = N
+        self.lonewolf = lonewolf
+        self.rng = rng
+        self.policy = policy if policy is not None else RandomPolicy(rng)
+        self.roles = [Role(role) for role in roles]
+        if shuffle:
+            rng.shuffle(self.roles)
+        self.initial_roles = copy(self.roles)
+
+        self.events = [] #everything that happened, in order; see Event
+        self.players_by_role = defaultdict(list) #which players currently believe they are role X
+        self.initial_players_by_role = defaultdict(list) #which players initially believe they are role X
+        self.players_by_category = {} #cache of players_in_category, kept up to date by add_player_role
         for i in range(N):
-            messages[i].append(during)
-        log.append(after or during)
+            self.add_player_role(i, self.roles[i].name)
+            self.initial_players_by_role[self.roles[i].name].append(i)
+
+        #list of (player, role) actions that need to be performed later
+        #(e.g. when doppelganger copies an insomniac, revealer, or god)
+        self.wrapup = []
+
+        self.shielded = []
+        self.revealed = []
+        self.marked = {}
+        self.wolf_card = Role("werewolf")
+        self.card_counts = Counter(role.name for role in self.roles) #how many of each role are in play
+        self.schedule = wake_schedule(self.card_counts)
+        self.wake_order = []
+        self.wake_order_str = None
+
+    def add_player_role(self, i, name):
+        self.players_by_role[name].append(i)
+        bit = 1 << role_ids[name]
+        for mask, players in self.players_by_category.items():
+            if bit & mask:
+                players.append(i)
+
+    #players who currently believe they are one of the roles in cat
+    #the result is shared with later calls, so don't modify it
+    def players_in_category(self, cat):
+        mask = category_mask(cat)
+        if mask not in self.players_by_category:
+            self.players_by_category[mask] = [player for role in cat for player in self.players_by_role[role]]
+        return self.players_by_category[mask]
+
+    #an event that only the players in audience see (None for everyone)
+    def event(self, audience, action, actor=None, targets=(), seen=()):
+        self.events.append(Event(audience, action, actor, targets, seen))
+
+    #an event that only its actor sees
+    def tell(self, i, action, targets=(), seen=()):
+        self.events.append(Event((i,), action, i, targets, seen))
+
+    #what player i has seen so far
+    def messages_for(self, i):
+        return render_messages(self.players, self.events, i)
+
+    @property
+    def messages(self):
+        return [self.messages_for(i) for i in range(self.N)]
+
+    @property
+    def log(self):
+        return render_log(self.players, self.events)
 
     #gives the list of targets for an action that preferentially targets a non-wolf
-    def try_for_nonwolf(i, doppelganged):
+    def try_for_nonwolf(self, i, doppelganged):
+        shielded = set(self.shielded)
+        allowed = [j for j in range(self.N) if i != j and j not in shielded]
         if not doppelganged:
-            return ([j for j in range(N) if j not in players_in_category(seen_as_wolves) and j != i and j not in shielded]
-                 or [j for j in range(N) if i != j and j not in shielded]) #if all valid targets are wolves, pick one of them
+            wolves = set(self.players_in_category(seen_as_wolves))
+            return ([j for j in allowed if j not in wolves]
+                 or allowed) #if all valid targets are wolves, pick one of them
         else: #doppelganger doesn't yet know who the wolves are, but prefentially avoids whoever they doppelganged
-            return ([j for j in range(N) if i != j and j not in shielded+doppelganged]
-                 or [j for j in range(N) if i != j and j not in shielded])
-
-    def do_role(i, role, doppelganged=[]):
-        #print(f"{players[i]} doing {role}")
-        #print(f"shielded = {shielded}")
-        #print(f"revealed   = {revealed}")
-        #print(f"roles = {roles}")
-        if role.name in ("werewolf", "dreamwolf", "minion", "villager", "hunter",
-                         "bodyguard", "merlin", "imposter", "tanner"):
-            pass
-        elif role.name == "sentinel":
+            return ([j for j in allowed if j not in doppelganged]
+                 or allowed)
+
+    #every random decision in the night goes through one of these, so that the policy
+    #can make it instead. point names the decision, e.g. "robber.target", and i is the
+    #player making it
+    def choose(self, point, i, options):
+        return self.policy.choose(self, point, i, options)
+
+    def chance(self, point, i, p):
+        return self.policy.chance(self, point, i, p)
+
+    def order(self, point, i, xs):
+        self.policy.order(self, point, i, xs)
+
+    #like random_choice, but the policy picks among the options
+    def pick(self, point, i, N, *excludes):
+        return self.choose(point, i, target_options(N, *excludes))
+
+    #a copy of this state that can be resolved separately, in O(N) time
+    #the cards are copied, since the PI and doppelganger write on them, and everything else
+    #that changes during the night is copied one level deep
+    def fork(self):
+        cards = {}
+        def card(role):
+            if role is None:
+                return None
+            if id(role) not in cards:
+                new_role = cards[id(role)] = Role.__new__(Role)
+                new_role.name, new_role.id, new_role.bit = role.name, role.id, role.bit
+                new_role.copied = card(role.copied)
+            return cards[id(role)]
+        new = object.__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        new.initial_roles = [card(role) for role in self.initial_roles]
+        new.roles = [card(role) for role in self.roles]
+        new.wolf_card = card(self.wolf_card)
+        new.wrapup = [(i, card(role)) for i, role in self.wrapup]
+        new.shielded = list(self.shielded)
+        new.revealed = list(self.revealed)
+        new.marked = dict(self.marked)
+        new.events = list(self.events)
+        new.players_by_role = defaultdict(list, {name: list(players) for name, players in self.players_by_role.items()})
+        new.players_by_category = {mask: list(players) for mask, players in self.players_by_category.items()}
+        new.card_counts = Counter(self.card_counts)
+        new.wake_order = list(self.wake_order)
+        return new
+
+    def swap_wolf_card(self, j):
+        self.card_counts[self.wolf_card.name] += 1
+        self.card_counts[self.roles[j].name] -= 1
+        self.roles[j], self.wolf_card = self.wolf_card, self.roles[j]
+
+    def do_role(self, i, role, doppelganged=[]):
+        role_handlers[role.name](self, i, role, doppelganged)
+
+    @wakes(tanner=10, villager=20, werewolf=60, imposter=70, dreamwolf=80, minion=110, merlin=120,
+           hunter=None, bodyguard=None)
+    def do_nothing(self, i, role, doppelganged):
+        pass
+
+    @wakes(sentinel=30)
+    def do_sentinel(self, i, role, doppelganged):
+        try:
+            j = self.pick("sentinel.shield", i, self.N, [i] + self.shielded)
+            self.shielded.append(j)
+            self.event(None, "shield", i, (j,))
+        except NoTarget:
+            self.tell(i, "mark.none")
+
+    @wakes(witch=240)
+    def do_witch(self, i, role, doppelganged):
+        j = self.pick("witch.center", i, 3)
+        role = self.roles[self.N+j]
+        self.tell(i, "look", (self.N+j,), (role,))
+        if role.bit & evil_mask and self.chance("witch.keep", i, 0.5) and i not in self.shielded:
+            target = i
+        else:
+            target = self.pick("witch.target", i, self.N, [i] + doppelganged, self.shielded)
+        rotate(self.roles, [target, self.N+j-1])
+        self.tell(i, "give", (target,), (role,))
+
+    @wakes(PI=200)
+    def do_pi(self, i, role, doppelganged):
+        exclude = [i] + self.shielded + doppelganged
+        for _ in range(2):
             try:
-                j = random_choice(N, [i] + shielded)
-                shielded.append(j)
-                broadcast_and_log(f"{players[j]} was marked with a shield",
-                                  f"{players[i]} marked {players[j]} with a shield")
-            except NoTarget:
-                broadcast_and_log(i, "had no one to mark")
-        elif role.name == "witch":
-            j = random_choice(3)
-            role = roles[N+j]
-            message_and_log(i, f"looked at center card {j+1} and saw {role}")
-            if role.name in evil and random.random() < 0.5 and i not in shielded:
-                target = i
-            else:
-                target = random_choice(N, [i] + doppelganged, shielded)
-            rotate(roles, [target, N+j-1])
-            message_and_log(i, f"gave {players[target]} role {role}")
-        elif role.name == "PI":
-            exclude = [i] + shielded + doppelganged
-            for _ in range(2):
-                try:
-                    j = random_choice(N, exclude)
-                    exclude.append(j)
-                    message_and_log(i, f"looked at {players[j]} and saw {roles[j]}")
-                    if roles[j].name in suspicious:
-                        message_and_log(i, f"became {roles[j]}")
-                        role.copied = roles[j]
-                        break
-                    if random.random() < 0.5:
-                        break
-                except NoTarget:
-                    message_and_log(i, "had no one to look at")
-        elif role.name == "medium":
-            for _ in range(2):
-                exclude = []
-                j = random_choice(3, exclude)
+                j = self.pick("PI.look", i, self.N, exclude)
                 exclude.append(j)
-                message_and_log(i, f"looked at center card {j+1} and saw {roles[N+j]}")
-                if roles[N+j].name in suspicious:
-                    message_and_log(i, f"became {roles[N+j]}")
-                    role.copied = roles[N+j]
+                self.tell(i, "look", (j,), (self.roles[j],))
+                if self.roles[j].bit & suspicious_mask:
+                    self.tell(i, "become", (), (self.roles[j],))
+                    role.copied = self.roles[j]
                     break
-                if random.random() < 0.5:
+                if self.chance("PI.stop", i, 0.5):
                     break
-        elif role.name == "curator":
-            if doppelganged:
-                wrapup.append((i, role))
-            else:
-                try:
-                    j = random_choice(N, [i]+shielded+list(marked.keys()))
-                    #TODO: in physical game, the same mark can't be given multiple times
-                    mark = random.choice(marks)
-                    marked[j] = mark
-                    messages[i].append(f"{players[i]} gave {players[j]} a mark")
-                    messages[j].append(f"{players[j]} received {mark}")
-                    for k in range(N):
-                        if k not in (i, j):
-                            messages[k].append(f"{players[j]} received a mark")
-                    log.append(f"{players[i]} gave {players[j]} {mark}")
-                except NoTarget:
-                    message_and_log(i, "had no one to mark")
-            pass
-        elif role.name in ("drunk", "fool"):
-            j = random_choice(3)
-            if role.name == "fool":
-                for k in range(3):
-                    if k != j:
-                        message_and_log(i, f"looked at center card {k+1} and saw {roles[N+k]}")
-            if i in shielded:
-                message_and_log(i, "did nothing, because they were shielded")
-            else:
-                message_and_log(i, f"took center card {j+1}",
-                                   f"took center card {j+1} which was {roles[N+j]}")
-                rotate(roles, (i, N+j))
-        elif role.name == "mysticwolf":
-            targets = try_for_nonwolf(i, doppelganged)
-            if not targets:
-                message_and_log(i, "looked at no one")
-            else:
-                j = random.choice(targets)
-                message_and_log(i, f"looked at {players[j]} and saw {roles[j]}")
-        elif role.name == "villageidiot":
-            to_rotate = [j for j in range(N) if j != i and j not in shielded]
-            if random.random() < 0.5:
-                to_rotate.reverse()
-            if random.random() < 0.2 or len(to_rotate) < 2:
-                message_and_log(i, "didn't rotate anyone")
-            else:
-                rotate_str = ' -> '.join([players[i] for i in to_rotate + [to_rotate[0]]])
-                rotate(roles, to_rotate)
-                message_and_log(i, f"rotated {rotate_str}")
-        elif role.name == "revealer":
-            if doppelganged:
-                wrapup.append((i, role))
-            else:
-                try:
-                    j = random_choice(N, [i] + shielded + revealed)
-                    if roles[j].name in suspicious:
-                        message_and_log(i, f"looked at {players[j]} and saw {roles[j]}, so did not reveal")
-                    else:
-                        revealed.append(j)
-                        broadcast_and_log(f"{players[j]} was revealed to be {roles[j]}",
-                                          f"{players[i]} revealed {players[j]} to be {roles[j]}")
-                except NoTarget:
-                    message_and_log(i, "had no one to reveal")
-        elif role.name == "doppelganger":
-            try:
-                j = random_choice(N, [i] + shielded + doppelganged)
-                role.copied = Role(roles[j].name)
-                message_and_log(i, f"doppelganged {players[j]}, who was {roles[j]}")
-                players_by_role[role.copied.name].append(i)
-                do_role(i, role.copied, doppelganged + [j])
             except NoTarget:
-                message_and_log(i, f"had no one to copy")
-        elif role.name == "seer":
-            looked = False
-            if random.random() < 0.5:
-                try:
-                    j = random_choice(N, [i] + doppelganged + shielded)
-                    message_and_log(i, f"looked at {players[j]} and saw {roles[j]}")
-                    looked = True
-                except NoTarget:
-                    looked = False
-            if not looked:
-                j = random_choice(3)
-                k = random_choice(3, [j])
-                for m in [j, k]:
-                    message_and_log(i, f"looked at center card {m+1} and saw {roles[N+m]}")
-        elif role.name == "madseer":
+                self.tell(i, "look.none")
+
+    @wakes(medium=210)
+    def do_medium(self, i, role, doppelganged):
+        for _ in range(2):
+            exclude = []
+            j = self.pick("medium.look", i, 3, exclude)
+            exclude.append(j)
+            self.tell(i, "look", (self.N+j,), (self.roles[self.N+j],))
+            if self.roles[self.N+j].bit & suspicious_mask:
+                self.tell(i, "become", (), (self.roles[self.N+j],))
+                role.copied = self.roles[self.N+j]
+                break
+            if self.chance("medium.stop", i, 0.5):
+                break
+
+    @wakes(curator=320)
+    def do_curator(self, i, role, doppelganged):
+        if doppelganged:
+            self.wrapup.append((i, role))
+        else:
             try:
-                j = random_choice(N, [i] + doppelganged + shielded)
-                k = random_choice(N, [j], [i] + doppelganged + shielded)
-                rolej = roles[j]
-                rolek = None
-                #if you see a madseer, should see double madseer, otherwise should see no madseer
-                while rolek is None or ((rolej.name == "madseer") != (rolek.name == "madseer")):
-                    rolek = roles[random_choice(N+3)]
-                true_message = f"looked at {players[j]} and saw {rolej}"
-                true_messages = (true_message, true_message)
-                false_message = f"looked at {players[k]} and saw {rolek}"
-                false_messages = (false_message, f"looked at {players[k]} and hallucinated {rolek}")
-                for during, after in random.choice([[true_messages, false_messages],
-                                                    [false_messages, true_messages]]):
-                    message_and_log(i, during, after)
+                j = self.pick("curator.target", i, self.N, [i]+self.shielded+list(self.marked.keys()))
+                #TODO: in physical game, the same mark can't be given multiple times
+                mark = self.choose("curator.mark", i, marks)
+                self.marked[j] = mark
+                #one event for everyone, see event_text["mark"] for who sees what
+                self.event(None, "mark", i, (j,), (mark,))
             except NoTarget:
-                message_and_log(i, f"had no one to look at")
-        elif role.name == "apprenticeseer":
-            j = random_choice(3)
-            message_and_log(i, f"looked at center card {j+1} and saw {roles[N+j]}")
-        elif role.name == "lucidwolf":
-            j = random_choice(3)
-            message_and_log(i, f"looked at center card {j+1} and saw {roles[N+j]}")
-        elif role.name in ("robber", "bandit"):
-            if i in shielded:
-                message_and_log(i, f"did nothing, because they were shielded")
-            else:
-                try:
-                    j = random_choice(N, doppelganged, [i] + shielded)
-                    if role.name == "robber":
-                        rotate(roles, (i, j))
-                        message_and_log(i, f"stole {roles[i]} from {players[j]}")
-                    elif role.name == "bandit":
-                        k = random_choice(3)
-                        msg = f"stole {roles[j]} from {players[j]} and gave them center card {k+1}"
-                        message_and_log(i, msg, f"{msg} which was {roles[N+k]}")
-                        rotate(roles, (j, i, N+k))
-                except NoTarget:
-                    message_and_log(i, f"couldn't rob anyone")
-        elif role.name == "alphawolf":
-            targets = try_for_nonwolf(i, doppelganged)
-            if not targets:
-                message_and_log(i, "turned no one into a wolf")
-            else:
-                j = random.choice(targets)
-                message_and_log(i, f"turned {players[j]} into a wolf",
-                                   f"exchanged {players[j]} with the wolf-card, which was {do_role.current_wolf_card.full_str()}")
-                roles[j], do_role.current_wolf_card = do_role.current_wolf_card, roles[j]
-        elif role.name == "insomniac":
-            if doppelganged:
-                wrapup.append((i, role))
-            else:
-                if i in shielded:
-                    message_and_log(i, f"did not see their role, because they were shielded")
+                self.tell(i, "mark.none")
+
+    @wakes(drunk=290, fool=280)
+    def do_drunk(self, i, role, doppelganged):
+        j = self.pick(f"{role.name}.center", i, 3)
+        if role.name == "fool":
+            for k in range(3):
+                if k != j:
+                    self.tell(i, "look", (self.N+k,), (self.roles[self.N+k],))
+        if i in self.shielded:
+            self.tell(i, "shielded")
+        else:
+            self.tell(i, "take", (self.N+j,), (self.roles[self.N+j],))
+            rotate(self.roles, (i, self.N+j))
+
+    @wakes(mysticwolf=100)
+    def do_mysticwolf(self, i, role, doppelganged):
+        targets = self.try_for_nonwolf(i, doppelganged)
+        if not targets:
+            self.tell(i, "look.nobody")
+        else:
+            j = self.choose("mysticwolf.look", i, targets)
+            self.tell(i, "look", (j,), (self.roles[j],))
+
+    @wakes(villageidiot=270)
+    def do_villageidiot(self, i, role, doppelganged):
+        shielded = set(self.shielded)
+        to_rotate = [j for j in range(self.N) if j != i and j not in shielded]
+        if self.chance("villageidiot.reverse", i, 0.5):
+            to_rotate.reverse()
+        if self.chance("villageidiot.skip", i, 0.2) or len(to_rotate) < 2:
+            self.tell(i, "rotate.none")
+        else:
+            rotate(self.roles, to_rotate)
+            self.tell(i, "rotate", tuple(to_rotate + [to_rotate[0]]))
+
+    @wakes(revealer=310)
+    def do_revealer(self, i, role, doppelganged):
+        if doppelganged:
+            self.wrapup.append((i, role))
+        else:
+            try:
+                j = self.pick("revealer.target", i, self.N, [i] + self.shielded + self.revealed)
+                if self.roles[j].bit & suspicious_mask:
+                    self.tell(i, "reveal.suspicious", (j,), (self.roles[j],))
                 else:
-                    messages[i].append(f"{players[i]} ended the night as {roles[i]}")
-        elif role.name == "mason":
-            messages[i].append(reveal_msg("mason", "masons", players, players_by_role['mason']))
-        elif role.name in ("loverwolf", "lovervillager"):
-            messages[i].append(reveal_msg("lover", "lovers", players, players_in_category(lovers)))
-        elif role.name in ("god", "enemyofreason"):
-            if doppelganged:
-                wrapup.append((i, role))
-            else:
-                for m in log:
-                    messages[i].append(f"[{role.name}] {m}")
-                #god takes their role back at the end of the night
-                #TODO: doppelganger should take back the doppelganger card
-                #(natural implementation is to have role be the doppelganger card,
-                # and replace role.name with role.copied.....name, but that sounds annoying)
-                for j in range(N):
-                    if j != i and roles[j] == role:
-                        message_and_log(i, f"took their original role back from {players[j]}")
-                        rotate(roles, (j, i))
-                for k in range(3):
-                    if roles[N+k] == role:
-                        message_and_log(i, f"took their original role back from center card {k+1}")
-                        rotate(roles, (N+k, i))
-                if do_role.current_wolf_card == role:
-                    message_and_log(i, f"took their original role back from the wolf-card")
-                    roles[i], do_role.current_wolf_card = do_role.current_wolf_card, roles[i]
-        elif role.name == "troublemaker":
+                    self.revealed.append(j)
+                    self.event(None, "reveal", i, (j,), (self.roles[j],))
+            except NoTarget:
+                self.tell(i, "reveal.none")
+
+    @wakes(doppelganger=40)
+    def do_doppelganger(self, i, role, doppelganged):
+        try:
+            j = self.pick("doppelganger.copy", i, self.N, [i] + self.shielded + doppelganged)
+            role.copied = Role(self.roles[j].name)
+            self.tell(i, "copy", (j,), (self.roles[j],))
+            self.add_player_role(i, role.copied.name)
+            self.do_role(i, role.copied, doppelganged + [j])
+        except NoTarget:
+            self.tell(i, "copy.none")
+
+    @wakes(seer=160)
+    def do_seer(self, i, role, doppelganged):
+        looked = False
+        if self.chance("seer.player", i, 0.5):
             try:
-                j = random_choice(N, [i] + shielded)
-                k = random_choice(N, [i, j] + shielded)
-                rotate(roles, (j, k))
-                message_and_log(i, f"switched {players[j]} and {players[k]}")
+                j = self.pick("seer.look", i, self.N, [i] + doppelganged + self.shielded)
+                self.tell(i, "look", (j,), (self.roles[j],))
+                looked = True
             except NoTarget:
-                message_and_log(i, "couldn't switch anybody")
-        elif role.name == "trickster":
+                looked = False
+        if not looked:
+            j = self.pick("seer.center", i, 3)
+            k = self.pick("seer.center", i, 3, [j])
+            for m in [j, k]:
+                self.tell(i, "look", (self.N+m,), (self.roles[self.N+m],))
+
+    @wakes(madseer=170)
+    def do_madseer(self, i, role, doppelganged):
+        try:
+            j = self.pick("madseer.look", i, self.N, [i] + doppelganged + self.shielded)
+            k = self.pick("madseer.hallucinate", i, self.N, [j], [i] + doppelganged + self.shielded)
+            rolej = self.roles[j]
+            #if you see a madseer, should see double madseer, otherwise should see no madseer
+            rolek = self.choose("madseer.hallucination", i, [role for role in self.roles
+                                     if (rolej.name == "madseer") == (role.name == "madseer")])
+            true_look = ("look", j, rolej)
+            false_look = ("hallucinate", k, rolek)
+            for action, target, seen in self.choose("madseer.order", i, [[true_look, false_look],
+                                                                        [false_look, true_look]]):
+                self.tell(i, action, (target,), (seen,))
+        except NoTarget:
+            self.tell(i, "look.none")
+
+    @wakes(apprenticeseer=180)
+    def do_apprenticeseer(self, i, role, doppelganged):
+        j = self.pick("apprenticeseer.center", i, 3)
+        self.tell(i, "look", (self.N+j,), (self.roles[self.N+j],))
+
+    @wakes(lucidwolf=190)
+    def do_lucidwolf(self, i, role, doppelganged):
+        j = self.pick("lucidwolf.center", i, 3)
+        self.tell(i, "look", (self.N+j,), (self.roles[self.N+j],))
+
+    @wakes(robber=220, bandit=230)
+    def do_robber(self, i, role, doppelganged):
+        if i in self.shielded:
+            self.tell(i, "shielded")
+        else:
             try:
-                j = random_choice(N, [i] + shielded)
-                center_index = random_choice(3)
-                message_and_log(i, f"gave the player with role {roles[j]} the new role {roles[N+center_index]}",
-                                   f"gave {players[j]} center card {center_index+1} which was {roles[N+center_index]}")
-                rotate(roles, (j, N+center_index))
+                j = self.pick(f"{role.name}.target", i, self.N, doppelganged, [i] + self.shielded)
+                if role.name == "robber":
+                    rotate(self.roles, (i, j))
+                    self.tell(i, "rob", (j,), (self.roles[i],))
+                elif role.name == "bandit":
+                    k = self.pick("bandit.center", i, 3)
+                    self.tell(i, "rob.bandit", (j, self.N+k), (self.roles[j], self.roles[self.N+k]))
+                    rotate(self.roles, (j, i, self.N+k))
             except NoTarget:
-                message_and_log(i, "couldn't switch anybody")
+                self.tell(i, "rob.none")
+
+    @wakes(alphawolf=90)
+    def do_alphawolf(self, i, role, doppelganged):
+        targets = self.try_for_nonwolf(i, doppelganged)
+        if not targets:
+            self.tell(i, "convert.none")
+        else:
+            j = self.choose("alphawolf.target", i, targets)
+            #the wolf-card may still be copied onto later, so keep what it was now
+            self.tell(i, "convert", (j,), (self.wolf_card.full_str(),))
+            self.swap_wolf_card(j)
+
+    @wakes(insomniac=300)
+    def do_insomniac(self, i, role, doppelganged):
+        if doppelganged:
+            self.wrapup.append((i, role))
         else:
-            raise ValueError(role.name)
-    do_role.current_wolf_card = Role("werewolf")
+            if i in self.shielded:
+                self.tell(i, "insomniac.shielded")
+            else:
+                self.tell(i, "insomniac", (), (self.roles[i],))
+
+    @wakes(mason=130)
+    def do_mason(self, i, role, doppelganged):
+        self.tell(i, "group", tuple(self.players_by_role['mason']), ("mason", "masons"))
+
+    @wakes(loverwolf=140, lovervillager=150)
+    def do_lovers(self, i, role, doppelganged):
+        self.tell(i, "group", tuple(self.players_in_category(lovers)), ("lover", "lovers"))
 
-    wake_order = []
-    def wake_role(role_name):
-        actors = list(initial_players_by_role[role_name])
-        random.shuffle(actors)
+    @wakes(god=340, enemyofreason=330)
+    def do_god(self, i, role, doppelganged):
+        if doppelganged:
+            self.wrapup.append((i, role))
+        else:
+            #sees the log of everything so far, see render_messages
+            self.tell(i, "god", (), (role.name,))
+            #god takes their role back at the end of the night
+            #TODO: doppelganger should take back the doppelganger card
+            #(natural implementation is to have role be the doppelganger card,
+            # and replace role.name with role.copied.....name, but that sounds annoying)
+            for j in range(self.N):
+                if j != i and self.roles[j] == role:
+                    self.tell(i, "take_back", (j,))
+                    rotate(self.roles, (j, i))
+            for k in range(3):
+                if self.roles[self.N+k] == role:
+                    self.tell(i, "take_back", (self.N+k,))
+                    rotate(self.roles, (self.N+k, i))
+            if self.wolf_card == role:
+                self.tell(i, "take_back", (self.N+3,))
+                self.swap_wolf_card(i)
+
+    @wakes(troublemaker=260)
+    def do_troublemaker(self, i, role, doppelganged):
+        try:
+            j = self.pick("troublemaker.first", i, self.N, [i] + self.shielded)
+            k = self.pick("troublemaker.second", i, self.N, [i, j] + self.shielded)
+            rotate(self.roles, (j, k))
+            self.tell(i, "switch", (j, k))
+        except NoTarget:
+            self.tell(i, "switch.none")
+
+    @wakes(trickster=250)
+    def do_trickster(self, i, role, doppelganged):
+        try:
+            j = self.pick("trickster.target", i, self.N, [i] + self.shielded)
+            center_index = self.pick("trickster.center", i, 3)
+            self.tell(i, "trick", (j, self.N+center_index), (self.roles[j], self.roles[self.N+center_index]))
+            rotate(self.roles, (j, self.N+center_index))
+        except NoTarget:
+            self.tell(i, "switch.none")
+
+    def wake_role(self, role_name):
+        actors = list(self.initial_players_by_role[role_name])
+        self.order(f"wake.{role_name}", None, actors)
         for i in actors:
-            do_role(i, initial_roles[i])
-        for i, role in wrapup:
+            self.do_role(i, self.initial_roles[i])
+        for i, role in self.wrapup:
             if role.name == role_name:
-                do_role(i, role)
-        if role_name in [role.name for role in roles]:
-            wake_order.append(role_name)
-
-    def do_werewolves():
-        seen_wolves = players_in_category(seen_as_wolves)
-        message = reveal_msg("wolf", "wolves", players, seen_wolves)
-        for i in players_in_category(see_wolves):
-            messages[i].append(message)
+                self.do_role(i, role)
+        if self.card_counts[role_name] > 0:
+            self.wake_order.append(role_name)
+
+    def do_werewolves(self):
+        seen_wolves = self.players_in_category(seen_as_wolves)
+        self.event(tuple(self.players_in_category(see_wolves)), "group",
+                   targets=tuple(seen_wolves), seen=("wolf", "wolves"))
         #werewolves separately learn who is sleeping, because they have thumbs out
-        message = reveal_msg("sleeping wolf", "sleeping wolves",
-                             players, players_in_category(sleepy_wolves))
-        for i in players_in_category(awake_wolves):
-            messages[i].append(message)
-        if len(seen_wolves) == 1 and lonewolf:
+        self.event(tuple(self.players_in_category(awake_wolves)), "group",
+                   targets=tuple(self.players_in_category(sleepy_wolves)),
+                   seen=("sleeping wolf", "sleeping wolves"))
+        if len(seen_wolves) == 1 and self.lonewolf:
             wolf = seen_wolves[0]
-            if wolf in players_in_category(awake_wolves):
-                j = random_choice(3)
-                message_and_log(wolf, f"looked at center card {j+1} and saw {roles[N+j]}")
+            if wolf in self.players_in_category(awake_wolves):
+                j = self.pick("werewolves.center", wolf, 3)
+                self.tell(wolf, "look", (self.N+j,), (self.roles[self.N+j],))
+
+
+    def resolve(self):
+        self.begin_night()
+        for step in self.schedule:
+            self.do_step(step)
+        self.end_night()
+        return self.result()
+
+    def begin_night(self):
+        self.event(None, "seating")
+        for i in range(self.N):
+            self.tell(i, "begin", (), (self.roles[i],))
+
+    def do_step(self, step):
+        if step == "werewolves":
+            self.do_werewolves()
+        else:
+            self.wake_role(step)
+
+    def end_night(self):
+        def make_wake_order_str(role):
+            num_roles = self.card_counts[role]
+            return role if num_roles == 1 else f"{role} (x{num_roles})"
+
+        indicators = ["1", "2", "3", "4", "5", "pinky", "fist", "thumb", "spidey", "hangloose"]
+
+        self.wake_order_str = ("\nWake order:\n\n" +
+                "\n".join([f"({i}) {make_wake_order_str(x)}"
+                           for i, x in zip(indicators, self.wake_order)]))
+        self.event(None, "wake_order", seen=(self.wake_order_str,))
+
+    def result(self):
+        return NightResult(self.players, self.initial_roles, self.roles, self.wolf_card,
+                           self.shielded, self.revealed, self.marked, self.wake_order,
+                           self.wake_order_str, self.events)
+
+#shuffle the roles and resolve one night, without any I/O
+#all randomness is drawn from rng, so that simulations can pass their own random.Random
+#pass a policy to make the night's decisions some other way
+def resolve_night(players, roles, lonewolf=True, rng=random, policy=None):
+    return GameState(players, roles, lonewolf, rng, policy=policy).resolve()
+
+#a random.Random that only depends on seed and key, e.g. derive_rng(seed, worker, game)
+#streams with different keys are independent, so parallel workers never share state
+def derive_rng(seed, *key):
+    digest = hashlib.sha256(json.dumps([seed, *key]).encode()).digest()
+    return random.Random(int.from_bytes(digest[:16], "big"))
+
+#63 bits, so that it fits in a signed 64 bit integer (e.g. in history.py's database)
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+#a night is determined by its seed and setup, so this is enough to replay it exactly
+#(the order of roles matters, since they are shuffled)
+def replay_record(seed, players, roles, lonewolf=True):
+    return json.dumps({"seed": seed, "players": list(players), "roles": list(roles),
+                       "lonewolf": lonewolf}, separators=(",", ":"))
+
+def replay(record):
+    record = json.loads(record)
+    return resolve_night(record["players"], record["roles"], record["lonewolf"],
+                         rng=random.Random(record["seed"]))
+
+#delivery is a backend from delivery.py for the players it can reach, and the computer is
+#passed around to everyone else. If history is the path of a database, the game is
+#recorded there (see history.py)
+def game(players, roles, lonewolf=True, use_slack=False, seed=None, delivery=None, history=None):
+    if seed is None:
+        seed = new_seed()
+    if delivery is None and use_slack:
+        delivery = get_backend("slack")
+    night = resolve_night(players, roles, lonewolf, rng=random.Random(seed))
+    if history is not None:
+        import history as game_history
+        game_history.record_game(history, night, roles, seed, lonewolf)
+    messages = night.messages
+    wake_order_str = night.wake_order_str
+    reachable = delivery.reachable(players) if delivery is not None else set()
 
     def display(text):
-        print(text)
-        if slack_ids:
-            for player in slack_ids:
-                post_message(slack_ids[player], text)
-    
-    for ms in messages:
-        ms.append(f"--------------------\nSeating order: {', '.join(players)}\n")
-
-    for i in range(N):
-        message_and_log(i, f"began the night as {roles[i]}")
-
-    wake_role("tanner")
-    wake_role("villager")
-    wake_role("sentinel")
-    wake_role("doppelganger")
-    do_werewolves()
-    wake_role("werewolf")
-    wake_role("imposter")
-    wake_role("dreamwolf")
-    wake_role("alphawolf")
-    wake_role("mysticwolf")
-    wake_role("minion")
-    wake_role("merlin")
-    wake_role("mason")
-    wake_role("loverwolf")
-    wake_role("lovervillager")
-    wake_role("seer")
-    wake_role("madseer")
-    wake_role("apprenticeseer")
-    wake_role("lucidwolf")
-    wake_role("PI")
-    wake_role("medium")
-    wake_role("robber")
-    wake_role("bandit")
-    wake_role("witch")
-    wake_role("trickster")
-    wake_role("troublemaker")
-    wake_role("villageidiot")
-    wake_role("fool")
-    wake_role("drunk")
-    wake_role("insomniac")
-    wake_role("revealer")
-    wake_role("curator")
-    wake_role("enemyofreason")
-    wake_role("god")
-
-    def make_wake_order_str(role):
-        num_roles = len([x for x in roles if x.name == role])
-        return role if num_roles == 1 else f"{role} (x{num_roles})"
-
-    indicators = ["1", "2", "3", "4", "5", "pinky", "fist", "thumb", "spidey", "hangloose"]
-
-    wake_order_str = ("\nWake order:\n\n" +
-            "\n".join([f"({i}) {make_wake_order_str(x)}"
-                       for i, x in zip(indicators, wake_order)]))
-    for ms in messages:
-        ms.append(wake_order_str)
-
-    for i, player in enumerate(players):
-        if player in slack_ids:
-            post_message([slack_ids[player]], '\n'.join(messages[i]))
-
-    mostly_slack = (len(players) <= len([p for p in players if p in slack_ids]) + 1)
-    for i, player in enumerate(players):
-        if player not in slack_ids:
-            clear()
-            print(f"pass the computer to {player}")
-            wait()
-            clear()
-            for message in messages[i]:
-                print(message)
-            if not mostly_slack:
-                wait()
-
-    if not mostly_slack:
+        #a terminal backend prints its announcements itself
+        if not isinstance(delivery, TerminalBackend):
+            print(text)
+        if reachable:
+            delivery.announce(text)
+
+    remote = [(player, '\n'.join(messages[i])) for i, player in enumerate(players) if player in reachable]
+    latencies = delivery.send(remote) if reachable else None
+
+    mostly_remote = (len(players) <= len([p for p in players if p in reachable]) + 1)
+    TerminalBackend(wait_after=not mostly_remote).send(
+        [(player, '\n'.join(messages[i])) for i, player in enumerate(players) if player not in reachable])
+
+    if not mostly_remote:
         clear()
         print(wake_order_str)
+    if latencies:
+        print("Delivered in " + ", ".join(f"{player} {t:.1f}s" if t is not None else f"{player} failed"
+                                          for (player, _), t in zip(remote, latencies)))
     try:
         print()
-        thinking = 60
-        discussing = 10 * 60
-        timer(display,
-              (0, "One minute to think before starting discussion... (press ctrl-c at any time to see the results)"),
-              (thinking, "Ten minutes to discuss until voting..."),
-              (thinking + discussing - 120, "Two minutes until voting..."),
-              (thinking + discussing - 30, "Thirty seconds until voting..."),
-              (thinking + discussing, "Time to vote!"))
+        (t, text), *rest = announcements()
+        timer(display, (t, text + " (press ctrl-c at any time to see the results)"), *rest)
     except KeyboardInterrupt:
         pass
     else:
         print("Press any key to see final roles")
         wait()
     finally:
-        def final_role_str(i):
-            result = f"{players[i]}: {roles[i].full_str()}"
-            if i in marked:
-                result += f" ({marked[i]})"
-            return result
         print()
-        log.append("\nFinal roles:")
-        log.extend([final_role_str(i) for i in range(N)])
-        display('\n'.join(log))
-
+        display(results_text(night, replay_record(seed, players, roles, lonewolf)))
+
+number_words = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+                "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen",
+                "eighteen", "nineteen"]
+tens_words = ["", "", "twenty", "thirty", "forty", "fifty"]
+
+def number_str(n):
+    if n < 20:
+        return number_words[n]
+    if n < 60:
+        return tens_words[n // 10] + ("-" + number_words[n % 10] if n % 10 else "")
+    return str(n)
+
+#e.g. 90 -> "One minute and thirty seconds"
+def duration_str(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    parts = [f"{number_str(k)} {unit}{'s' if k != 1 else ''}"
+             for k, unit in [(minutes, "minute"), (seconds, "second")] if k]
+    return " and ".join(parts or ["zero seconds"]).capitalize()
+
+#(seconds from the end of the night, text) for each announcement during the day
+#the warnings before voting are left out if they would come before the discussion starts
+def announcements(thinking=60, discussing=10 * 60):
+    result = []
+    if thinking > 0:
+        result.append((0, f"{duration_str(thinking)} to think before starting discussion..."))
+    result.append((thinking, f"{duration_str(discussing)} to discuss until voting..."))
+    for warning in (120, 30):
+        if discussing > warning:
+            result.append((thinking + discussing - warning, f"{duration_str(warning)} until voting..."))
+    result.append((thinking + discussing, "Time to vote!"))
+    return result
+
+#what everyone sees at the end of the game: the log, the final roles and how to replay it
+def results_text(night, replay):
+    N = len(night.players)
+    return '\n'.join(night.log + ["\nFinal roles:"] +
+                     [night.final_role_str(i) for i in range(N)] +
+                     [f"\nReplay: {replay}"])
+
+#times are measured from the start, so that slow calls to f don't delay later events
 def timer(f, *events):
-    current = 0
+    start = time.monotonic()
     for t, event in events:
-        time.sleep(t-current)
-        current=t
+        time.sleep(max(0, start + t - time.monotonic()))
         f(event)
 
-def wait():
-    input()
-
-def clear():
-    os.system('cls' if os.name == 'nt' else 'clear')
-
 def rotate(xs, locations):
     values = [xs[i] for i in locations]
     for loc, value in zip(locations, [values[-1]] + values[:-1]):
@@ -507,14 +898,18 @@ class NoTarget(Exception):
 #pick something from none of the excludes if possible
 #otherwise, start trying to pick from the first of the excludes
 #never pick from the last of the excludes, raise NoTarget if there are no options
-def random_choice(N, *excludes):
-    all_excludes = [x for exclude in excludes for x in exclude]
-    options = [i for i in list(range(N)) if i not in all_excludes]
+def random_choice(N, *excludes, rng=random):
+    return rng.choice(target_options(N, *excludes))
+
+#the options random_choice picks from
+def target_options(N, *excludes):
+    all_excludes = set().union(*excludes)
+    options = [i for i in range(N) if i not in all_excludes]
     if options:
-        return random.choice(options)
+        return options
     for exclude in excludes[:-1]:
         if exclude:
-            return random.choice(exclude)
+            return exclude
     raise NoTarget()
 
 def reveal_msg(singular, plural, players, people):
@@ -528,7 +923,18 @@ def reveal_msg(singular, plural, players, people):
 
 
 if __name__ == '__main__':
+    if sys.argv[1] == "replay":
+        print(results_text(replay(sys.argv[2]), sys.argv[2]))
+        sys.exit()
     players = sys.argv[1]
     roles = sys.argv[2]
-    game(players.split(","), roles.split(","), use_slack='slack' in sys.argv)
+    options = dict(arg.split("=", 1) for arg in sys.argv[3:] if "=" in arg)
+    delivery = None
+    if "file" in options:
+        delivery = get_backend("file", options["file"])
+    elif "webhook" in options:
+        delivery = get_backend("webhook", options["webhook"])
+    game(players.split(","), roles.split(","), use_slack='slack' in sys.argv,
+         seed=int(options["seed"]) if "seed" in options else None, delivery=delivery,
+         history=options.get("history"))
 
@@ -0,0 +1,201 @@
+import re
+import random
+import time
+from collections import Counter, OrderedDict
+from onuw import GameState, RandomPolicy, SeatPolicy, awake_wolves, event_text, location_str
+from exact import step_outcomes
+
+"""
+Answers "what are the final roles, given what I saw?" for one player.
+
+Worlds are simulated with the usual random policies, and weighted by how likely they
+make the player's messages:
+
+    * the deal always gives the player the role they began the night as
+    * cards the player looked at are usually dealt where they were seen, and the
+      worlds are importance weighted so that the answer is the same as for a
+      uniform deal. Otherwise almost every deal would be dropped for a seer or PI
+    * the player's own decisions are enumerated rather than sampled, and each way they
+      could have gone is weighted by its probability
+
+Each world is kept under the messages the player got in it, with its weight relative to
+a uniform deal. So the worlds simulated for one question also answer any later question
+from the same seat in the same setup, and more are only simulated when there are too
+few matching ones. Worlds simulated for another question can be weighted very unevenly
+for this one, so "enough" is counted as the effective number of worlds, (sum w)^2 / sum w^2,
+rather than the raw count. The worlds for the most recently asked cache_size (setup, seat)
+pairs are kept.
+"""
+
+#the posterior for one player's observation
+class Posterior():
+    def __init__(self, players, roles, outcomes, worlds, matches):
+        self.players = players
+        self.roles = roles
+        self.outcomes = outcomes #(final roles including the center, wolf-card) -> weight
+        self.worlds = worlds #how many worlds were simulated
+        self.matches = matches #the effective number of them that produced the observation
+
+    #for each location (players, then center), the probability of each role ending up there
+    def final_roles(self):
+        total = sum(self.outcomes.values())
+        result = [Counter() for _ in self.roles]
+        for (final, wolf_card), weight in self.outcomes.items():
+            for location, role in enumerate(final):
+                result[location][role] += weight / total
+        return result
+
+    def wolf_card(self):
+        total = sum(self.outcomes.values())
+        result = Counter()
+        for (final, wolf_card), weight in self.outcomes.items():
+            result[wolf_card] += weight / total
+        return result
+
+#every world simulated for one seat in one setup, by the messages the seat got in it
+class Worlds():
+    def __init__(self):
+        self.outcomes = {} #messages -> Counter of (final roles, wolf-card) -> weight
+        self.weights = Counter() #messages -> total weight of the worlds ending with them
+        self.squares = Counter() #messages -> total squared weight
+        self.count = 0
+
+    def add(self, leaves):
+        for messages, outcome, weight in leaves:
+            self.outcomes.setdefault(messages, Counter())[outcome] += weight
+            self.weights[messages] += weight
+            self.squares[messages] += weight * weight
+        self.count += 1
+
+    #the effective number of worlds ending with messages
+    def matches(self, messages):
+        if not self.squares[messages]: return 0
+        return self.weights[messages] ** 2 / self.squares[messages]
+
+cache_size = 16
+_cache = OrderedDict() #(setup, seat) -> Worlds, least recently asked first
+
+#the posterior over final roles for player seat, who saw messages
+#keeps simulating until there are effectively min_matches consistent worlds or time_limit seconds pass
+def posterior(players, roles, seat, messages, lonewolf=True, rng=random,
+              min_matches=500, time_limit=1.0):
+    key = (tuple(players), tuple(sorted(roles)), lonewolf, seat)
+    worlds = _cache.pop(key, None) or Worlds()
+    _cache[key] = worlds
+    while len(_cache) > cache_size:
+        _cache.popitem(last=False)
+    messages = tuple(messages)
+    starting_role = initial_role(players[seat], messages)
+    deal = Deal(roles, seat, starting_role, observed_cards(players, roles, seat, messages))
+    deadline = time.monotonic() + time_limit
+    while worlds.matches(messages) < min_matches and time.monotonic() < deadline:
+        worlds.add(sample_world(players, seat, deal, lonewolf, rng))
+    return Posterior(players, roles, Counter(worlds.outcomes.get(messages, {})), worlds.count,
+                     worlds.matches(messages))
+
+def initial_role(player, messages):
+    prefix = f"{player} began the night as "
+    for message in messages:
+        if message.startswith(prefix):
+            return message[len(prefix):]
+    raise ValueError(f"{player} never began the night")
+
+#messages in which a player sees the card at one location
+observations = ("look", "copy", "rob", "reveal.suspicious")
+
+#(location, role) for each card that seat saw in messages, at most one per location
+def observed_cards(players, roles, seat, messages):
+    locations = {location_str(players, j): j for j in range(len(roles))}
+    patterns = []
+    for action in observations:
+        text = event_text[action]
+        text = text[0] if isinstance(text, tuple) else text
+        pattern = re.escape(text).replace(re.escape("{actor}"), re.escape(players[seat]))
+        pattern = pattern.replace(re.escape("{target}"), "(?P<target>.+)").replace(re.escape("{seen}"), "(?P<seen>.+)")
+        patterns.append(re.compile(pattern))
+    result = {}
+    for message in messages:
+        for pattern in patterns:
+            match = pattern.fullmatch(message)
+            if match and match["target"] in locations and match["seen"] in roles:
+                result.setdefault(locations[match["target"]], match["seen"])
+    return [(j, name) for j, name in result.items() if j != seat]
+
+#deals with seat's starting role, drawn from a mixture of a uniform deal and, with probability
+#pinned, a deal with every observed card where it was seen. Each deal comes with the weight
+#that makes the mixture count the same as a uniform deal
+class Deal():
+    pinned = 0.9
+
+    def __init__(self, roles, seat, starting_role, observed):
+        self.seat = seat
+        self.starting_role = starting_role
+        self.rest = list(roles)
+        self.rest.remove(starting_role)
+        #the probability that a uniform deal puts every observed card where it was seen
+        #(cards seen more often than there are copies must have moved, and aren't pinned)
+        left = Counter(self.rest)
+        self.observed = []
+        self.p_observed = 1.0
+        for j, name in observed:
+            if left[name] > 0:
+                self.p_observed *= left[name] / (len(self.rest) - len(self.observed))
+                self.observed.append((j, name))
+                left[name] -= 1
+        self.unobserved = list(left.elements())
+
+    def matches(self, dealt):
+        return all(dealt[j] == name for j, name in self.observed)
+
+    def sample(self, rng):
+        if self.observed and rng.random() < self.pinned:
+            dealt = list(self.unobserved)
+            rng.shuffle(dealt)
+            free = iter(dealt)
+            observed = dict(self.observed)
+            dealt = [self.starting_role if j == self.seat else observed[j] if j in observed else next(free)
+                     for j in range(len(self.rest) + 1)]
+        else:
+            dealt = list(self.rest)
+            rng.shuffle(dealt)
+            dealt.insert(self.seat, self.starting_role)
+        if not self.observed:
+            return dealt, 1.0
+        return dealt, 1 / (1 - self.pinned + self.pinned * self.matches(dealt) / self.p_observed)
+
+#simulates one deal, branching on seat's decisions
+#returns (seat's messages, outcome, weight) for each way the night could have gone
+def sample_world(players, seat, deal, lonewolf, rng):
+    dealt, weight = deal.sample(rng)
+    others = RandomPolicy(rng)
+    state = GameState(players, dealt, lonewolf, rng, shuffle=False, policy=others)
+    state.begin_night()
+    particles = [(state, weight)]
+    for step in state.schedule:
+        #every replay of the step must make the same decisions for everyone else, so that
+        #the script's choices for seat line up, so they are drawn from the same seed each time
+        step_seed = rng.getrandbits(64)
+        enumerate_seat = lambda script: SeatPolicy({seat: script}, RandomPolicy(random.Random(step_seed)))
+        stepped = []
+        for state, weight in particles:
+            if decides(state, seat, step):
+                for fork, p in step_outcomes(state, step, enumerate_seat):
+                    fork.policy = others
+                    stepped.append((fork, weight * p))
+            else:
+                state.do_step(step)
+                stepped.append((state, weight))
+        particles = stepped
+    leaves = []
+    for state, weight in particles:
+        state.end_night()
+        outcome = (tuple(role.full_str() for role in state.roles), state.wolf_card.full_str())
+        leaves.append((tuple(state.messages_for(seat)), outcome, weight))
+    return leaves
+
+#whether seat might make a decision during step
+def decides(state, seat, step):
+    if step == "werewolves":
+        return seat in state.players_in_category(awake_wolves)
+    return (state.initial_roles[seat].name == step
+            or any(i == seat and role.name == step for i, role in state.wrapup))
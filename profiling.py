@@ -0,0 +1,151 @@
+import json
+import time
+import threading
+from collections import Counter, defaultdict
+import onuw
+
+"""
+Optional instrumentation, to see where the time in a night or a slack delivery goes.
+
+    stats = profiling.enable(trace="trace.jsonl")
+    ...
+    profiling.disable()
+    print(stats.report())
+
+While enabled, GameState.wake_role, do_werewolves, do_role and resolve, rendering of
+messages and the log, and SlackClient.api_call are replaced by timed wrappers that
+count calls and wall time for each role and api method, slack retries and rejections,
+and the number of events, messages and log lines. disable() puts the originals back, so
+when profiling is off nothing is wrapped and it costs nothing.
+
+Times are inclusive: a doppelganger's do_role includes the role they copied.
+If trace is given, every timed call is also written to it as a line of JSON.
+"""
+
+class Stats():
+    def __init__(self, trace=None):
+        self.calls = Counter()
+        self.time = defaultdict(float)
+        self.counts = Counter() #everything that isn't timed, e.g. retries and sizes
+        self.lock = threading.Lock()
+        self.trace = open(trace, "w") if trace else None
+
+    def add(self, key, start, elapsed):
+        with self.lock:
+            self.calls[key] += 1
+            self.time[key] += elapsed
+            if self.trace:
+                self.trace.write(json.dumps({"name": key, "start": start, "seconds": elapsed,
+                                             "thread": threading.current_thread().name}) + "\n")
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def close(self):
+        if self.trace:
+            self.trace.close()
+            self.trace = None
+
+    #a table of calls, total and mean time, slowest first, then the counts
+    def report(self):
+        lines = [f"{'':32} {'calls':>8} {'total ms':>10} {'mean us':>10}"]
+        for key in sorted(self.time, key=self.time.get, reverse=True):
+            lines.append(f"{key:32} {self.calls[key]:8} {self.time[key] * 1e3:10.2f} "
+                         f"{self.time[key] / self.calls[key] * 1e6:10.1f}")
+        for key, n in sorted(self.counts.items()):
+            lines.append(f"{key:32} {n:8}")
+        return "\n".join(lines)
+
+_stats = None
+_originals = []
+
+#calls to f are timed under key(*args)
+def timed(f, key):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _stats.add(key(*args), start, time.perf_counter() - start)
+    return wrapper
+
+def patch(owner, name, wrapper):
+    original = getattr(owner, name)
+    _originals.append((owner, name, original))
+    setattr(owner, name, wrapper(original))
+
+def resolve_wrapper(resolve):
+    def wrapper(self):
+        result = resolve(self)
+        _stats.count("night.nights")
+        _stats.count("night.events", len(self.events))
+        return result
+    return timed(wrapper, lambda self: "night.resolve")
+
+def render_messages_wrapper(render_messages):
+    def wrapper(players, events, i):
+        result = render_messages(players, events, i)
+        _stats.count("render.messages.lines", len(result))
+        return result
+    return timed(wrapper, lambda *args: "render.messages")
+
+def render_log_wrapper(render_log):
+    def wrapper(players, events, stop=None):
+        result = render_log(players, events, stop)
+        _stats.count("render.log.lines", len(result))
+        return result
+    return timed(wrapper, lambda *args: "render.log")
+
+def api_call_wrapper(api_call):
+    def wrapper(self, method, **params):
+        retries = self.retries
+        result = api_call(self, method, **params)
+        if self.retries > retries:
+            _stats.count(f"slack.retries.{method}", self.retries - retries)
+        if not result.get("ok", True):
+            _stats.count(f"slack.rejected.{method}")
+        return result
+    return timed(wrapper, lambda self, method, **params: f"slack.{method}")
+
+#start profiling, and return the Stats that will be filled in
+def enable(trace=None):
+    global _stats
+    if _stats is not None:
+        disable()
+    _stats = Stats(trace)
+    GameState = onuw.GameState
+    patch(GameState, "resolve", resolve_wrapper)
+    patch(GameState, "wake_role", lambda f: timed(f, lambda self, role_name: f"wake.{role_name}"))
+    patch(GameState, "do_werewolves", lambda f: timed(f, lambda self: "wake.werewolves"))
+    patch(GameState, "do_role", lambda f: timed(f, lambda self, i, role, doppelganged=[]: f"role.{role.name}"))
+    patch(onuw, "render_messages", render_messages_wrapper)
+    patch(onuw, "render_log", render_log_wrapper)
+    try:
+        import slack
+    except ImportError:
+        pass #slack isn't set up, so there's nothing to profile there
+    else:
+        patch(slack.SlackClient, "api_call", api_call_wrapper)
+        patch(slack, "post_message", lambda f: timed(f, lambda *args: "slack.post_message"))
+    return _stats
+
+def disable():
+    global _stats
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+    if _stats is not None:
+        _stats.close()
+    stats, _stats = _stats, None
+    return stats
+
+class profile():
+    def __init__(self, trace=None):
+        self.trace = trace
+
+    def __enter__(self):
+        return enable(self.trace)
+
+    def __exit__(self, *exc):
+        disable()
@@ -0,0 +1,129 @@
+import numpy as np
+from onuw import role_names, role_ids, marks, all_wolves
+
+"""
+Decides who won, given the roles at the end of the night, the marks and the vote.
+
+votes[i] is the player that player i voted for. The players with the most votes die,
+unless no one got more than one vote. A bodyguard's vote protects that player, so the
+unprotected players with the most votes die instead, and a hunter who dies takes the
+player they voted for with them.
+
+    * village wins if a werewolf dies, or if no player is a werewolf and no one dies
+    * werewolves win if there is a werewolf and none of them nor a tanner dies.
+      A minion wins with the werewolves, or if there are none, when someone dies
+      but no minion or tanner does
+    * a tanner wins if they die
+    * the village loses if every werewolf voted for merlin
+    * lovers win if any lover wins, since they are on each other's team
+    * the imposter is only seen as a wolf, and plays for the village
+    * the enemy of reason plays like a minion: it wins with the werewolves, but
+      killing it doesn't count as killing a werewolf
+    * a mark of villager, werewolf or tanner puts a player on that team
+
+Everything is computed on arrays with one row per (outcome, vote), so that millions of
+them can be scored at once; score and score_night score a single night.
+"""
+
+village, werewolf, tanner = 0, 1, 2
+
+team_of = {name: village for name in role_names}
+team_of.update({name: werewolf for name in all_wolves + ("minion", "enemyofreason")})
+team_of["tanner"] = tanner
+role_teams = np.array([team_of[name] for name in role_names], dtype=np.int8)
+
+mark_teams = {"mark of villager": village, "mark of werewolf": werewolf, "mark of tanner": tanner}
+#team given by each mark in onuw.marks, or -1 if it doesn't change teams
+#the extra entry at the end is for unmarked players, whose mark index is -1
+mark_team_ids = np.array([mark_teams.get(mark, -1) for mark in marks] + [-1], dtype=np.int8)
+
+lover_ids = [role_ids["loverwolf"], role_ids["lovervillager"]]
+#on the werewolf team without being werewolves
+minion_ids = [role_ids["minion"], role_ids["enemyofreason"]]
+
+#which players die, as a (games, N) bool array
+def deaths(roles, votes):
+    games, N = votes.shape
+    rows = np.arange(games)[:, None]
+    counts = np.bincount((votes + N * rows).ravel(), minlength=games * N).reshape(games, N)
+    protected = np.zeros((games, N), dtype=bool)
+    bodyguards = roles == role_ids["bodyguard"]
+    protected[np.broadcast_to(rows, votes.shape)[bodyguards], votes[bodyguards]] = True
+    counts = np.where(protected, 0, counts)
+    most = counts.max(axis=1, keepdims=True)
+    dead = (counts == most) & (most > 1)
+    #each hunter who dies takes someone with them, who might be another hunter
+    hunters = roles == role_ids["hunter"]
+    shot = np.zeros((games, N), dtype=bool)
+    while True:
+        shooting = dead & hunters & ~shot
+        if not shooting.any():
+            return dead
+        shot |= shooting
+        dead[np.broadcast_to(rows, votes.shape)[shooting], votes[shooting]] = True
+
+#which players win, as a (games, N) bool array
+#roles are (games, N) role ids at the end of the night (what was copied, for copiers),
+#votes are (games, N) seats, and marked is (games, N) indexes into onuw.marks or -1
+def score_batch(roles, votes, marked=None):
+    roles = np.asarray(roles)
+    votes = np.asarray(votes)
+    games, N = roles.shape
+    rows = np.arange(games)
+    team = role_teams[roles]
+    if marked is not None:
+        mark_team = mark_team_ids[np.asarray(marked)]
+        team = np.where(mark_team >= 0, mark_team, team)
+    minion = np.isin(roles, minion_ids) & (team == werewolf)
+    if marked is not None:
+        minion &= np.asarray(marked) != marks.index("mark of werewolf")
+    wolf = (team == werewolf) & ~minion
+    dead = deaths(roles, votes)
+
+    any_wolves = wolf.any(axis=1)
+    wolf_died = (dead & wolf).any(axis=1)
+    tanner_died = (dead & (team == tanner)).any(axis=1)
+    minion_died = (dead & minion).any(axis=1)
+    anyone_died = dead.any(axis=1)
+    #merlin is found if every wolf voted for the same player, who is merlin
+    target = np.where(wolf, votes, -1).max(axis=1)
+    unanimous = ((votes == target[:, None]) | ~wolf).all(axis=1)
+    merlin_found = any_wolves & unanimous & (roles[rows, np.maximum(target, 0)] == role_ids["merlin"])
+
+    village_wins = np.where(any_wolves, wolf_died, ~anyone_died) & ~merlin_found
+    werewolves_win = np.where(any_wolves, ~wolf_died & ~tanner_died,
+                              anyone_died & ~minion_died & ~tanner_died)
+    wins = np.where(team == village, village_wins[:, None],
+                    np.where(team == werewolf, werewolves_win[:, None], dead))
+    lover = np.isin(roles, lover_ids)
+    return wins | (lover & (wins & lover).any(axis=1, keepdims=True))
+
+#the role each player ended the night as, as ids, for a batch.BatchResult
+#copiers (doppelganger, PI, medium) count as whatever they copied
+def final_role_ids(result):
+    N = len(result.players)
+    cards = result.final[:, :N]
+    copied = np.take_along_axis(result.copied, cards, axis=1)
+    return np.where(copied >= 0, copied, result.card_roles[cards])
+
+#every player votes for a uniformly random other player
+def random_votes(games, N, rng=None):
+    rng = np.random.default_rng(rng)
+    votes = rng.integers(N - 1, size=(games, N))
+    return votes + (votes >= np.arange(N))
+
+#the role a card counts as for scoring
+def scored_role(role):
+    while role.copied is not None:
+        role = role.copied
+    return role.name
+
+#which players win one game, given a list of role names, votes, and a dict of marks
+def score(roles, votes, marked={}):
+    N = len(votes)
+    ids = np.array([[role_ids[name] for name in roles[:N]]])
+    marked = np.array([[marks.index(marked[i]) if i in marked else -1 for i in range(N)]])
+    return [bool(x) for x in score_batch(ids, np.array([votes]), marked)[0]]
+
+def score_night(night, votes):
+    return score([scored_role(role) for role in night.roles], votes, night.marked)
@@ -0,0 +1,239 @@
+import sys
+import json
+import random
+import asyncio
+import secrets
+from urllib.parse import urlsplit, parse_qs
+from onuw import resolve_night, new_seed, replay_record, announcements, results_text, valid_roles
+
+"""
+Usage: `python server.py [port]`
+
+Hosts any number of tables at once, in one process, over plain HTTP:
+
+    POST /tables                  {"players": [...], "roles": [...]} starts a table, and
+                                  returns a private feed url for each player and a host
+                                  token. Also takes "lonewolf", "seed", "thinking" and
+                                  "discussing" (seconds)
+    GET  /tables                  lists the tables
+    POST /tables/<id>/reveal      {"host": token} ends the day early and shows everyone
+                                  the results
+    GET  /feed/<token>?after=k    long-polls for the player's messages after the first k
+    GET  /feed/<token>/stream     the same messages as server-sent events
+
+Every player gets their night messages at the same moment, when the table starts, and
+then the same announcements as in the terminal game. The results are shown when the
+table is revealed.
+"""
+
+#how long a request waits for new messages before returning none
+long_poll_timeout = 30
+#how long a revealed table is kept, so that late readers can still see the results
+keep_revealed = 60 * 60
+#how long a table that nobody reveals is kept after its time to vote
+keep_unrevealed = 60 * 60
+
+tables = {}
+feeds = {} #token -> (table, player index)
+
+class Table():
+    def __init__(self, table_id, players, roles, lonewolf=True, seed=None,
+                 thinking=60, discussing=10 * 60):
+        self.id = table_id
+        self.players = players
+        self.seed = new_seed() if seed is None else seed
+        self.night = resolve_night(players, roles, lonewolf, rng=random.Random(self.seed))
+        self.replay = replay_record(self.seed, players, roles, lonewolf)
+        self.schedule = announcements(thinking, discussing)
+        self.tokens = [secrets.token_urlsafe(12) for _ in players]
+        self.host = secrets.token_urlsafe(12) #needed to reveal the table
+        self.feeds = [[] for _ in players] #what each player has been sent so far
+        self.changed = asyncio.Event() #set, and replaced, whenever something is sent
+        self.started_at = None
+        self.revealed_at = None
+        self.timers = None
+
+    def send(self, text, to=None):
+        for i in range(len(self.players)) if to is None else to:
+            self.feeds[i].append(text)
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def start(self):
+        self.started_at = asyncio.get_running_loop().time()
+        #nothing is awaited here, so every player gets their messages at the same moment
+        for i, messages in enumerate(self.night.messages):
+            self.send('\n'.join(messages), to=[i])
+        self.timers = asyncio.create_task(self.run_timers())
+
+    #like onuw.timer, but without holding up the other tables
+    async def run_timers(self):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for t, text in self.schedule:
+            await asyncio.sleep(max(0, start + t - loop.time()))
+            self.send(text)
+
+    def reveal(self):
+        if self.revealed_at is not None:
+            return
+        if self.timers is not None:
+            self.timers.cancel()
+        self.revealed_at = asyncio.get_running_loop().time()
+        self.send(results_text(self.night, self.replay))
+
+    #player i's messages after the first after, waiting up to timeout seconds for some
+    async def wait(self, i, after, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        #something may be sent to other players first, so keep waiting until it's for i
+        while len(self.feeds[i]) <= after and self.revealed_at is None and loop.time() < deadline:
+            try:
+                await asyncio.wait_for(self.changed.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                pass
+        return self.feeds[i][after:]
+
+    #whether the table can be forgotten, because it was revealed, or abandoned after the vote
+    def expired(self, now):
+        if self.revealed_at is not None:
+            return now - self.revealed_at > keep_revealed
+        if self.started_at is None:
+            return True #it never started, so no one can be waiting for it
+        return now - self.started_at > self.schedule[-1][0] + keep_unrevealed
+
+    def summary(self):
+        return {"id": self.id, "players": self.players, "revealed": self.revealed_at is not None}
+
+def create_table(spec):
+    if not isinstance(spec["players"], list) or not isinstance(spec["roles"], list):
+        raise ValueError("players and roles must be lists")
+    players = list(spec["players"])
+    roles = list(spec["roles"])
+    if not all(isinstance(player, str) for player in players) or len(set(players)) != len(players):
+        raise ValueError("players must be distinct names")
+    if not all(isinstance(role, str) for role in roles):
+        raise ValueError("roles must be names")
+    if len(roles) != len(players) + 3:
+        raise ValueError("there must be 3 more roles than players")
+    unknown = [role for role in roles if role not in valid_roles]
+    if unknown:
+        raise ValueError(f"unknown roles {unknown}")
+    table_id = secrets.token_hex(4)
+    table = Table(table_id, players, roles, spec.get("lonewolf", True), spec.get("seed"),
+                  spec.get("thinking", 60), spec.get("discussing", 10 * 60))
+    #only tables that started are registered, so a bad spec leaves nothing behind
+    table.start()
+    tables[table_id] = table
+    for i, token in enumerate(table.tokens):
+        feeds[token] = (table, i)
+    return {"id": table_id, "host": table.host,
+            "feeds": {player: f"/feed/{token}" for player, token in zip(players, table.tokens)}}
+
+def remove_table(table):
+    del tables[table.id]
+    for token in table.tokens:
+        del feeds[token]
+
+async def clean_up():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(60)
+        for table in list(tables.values()):
+            if table.expired(loop.time()):
+                remove_table(table)
+
+async def read_request(reader):
+    request_line = (await reader.readline()).decode()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode()
+        if line in ("\r\n", "\n", ""):
+            break
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, urlsplit(target), body
+
+def response(status, data):
+    body = json.dumps(data).encode()
+    return (f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body
+
+async def stream(writer, table, i):
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                 b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+    sent = 0
+    while True:
+        messages = await table.wait(i, sent, long_poll_timeout)
+        for message in messages:
+            writer.write(f"data: {json.dumps(message)}\n\n".encode())
+        if not messages:
+            writer.write(b": keep-alive\n\n")
+        sent += len(messages)
+        await writer.drain()
+        if table.revealed_at is not None and sent == len(table.feeds[i]):
+            return
+
+async def route(method, url, body, writer):
+    parts = [part for part in url.path.split("/") if part]
+    if method == "POST" and parts == ["tables"]:
+        try:
+            return response("201 Created", create_table(json.loads(body)))
+        except (ValueError, KeyError, TypeError) as e:
+            return response("400 Bad Request", {"error": str(e)})
+    if method == "GET" and parts == ["tables"]:
+        return response("200 OK", [table.summary() for table in tables.values()])
+    if method == "POST" and len(parts) == 3 and parts[0] == "tables" and parts[2] == "reveal":
+        if parts[1] not in tables:
+            return response("404 Not Found", {"error": "no such table"})
+        try:
+            host = json.loads(body).get("host") if body else None
+        except (ValueError, AttributeError):
+            host = None
+        if not isinstance(host, str) or not secrets.compare_digest(host, tables[parts[1]].host):
+            return response("403 Forbidden", {"error": "only the host can reveal the table"})
+        tables[parts[1]].reveal()
+        return response("200 OK", tables[parts[1]].summary())
+    if method == "GET" and len(parts) in (2, 3) and parts[0] == "feed":
+        if parts[1] not in feeds:
+            return response("404 Not Found", {"error": "no such feed"})
+        table, i = feeds[parts[1]]
+        if len(parts) == 3 and parts[2] == "stream":
+            await stream(writer, table, i)
+            return None
+        after = int(parse_qs(url.query).get("after", ["0"])[0])
+        messages = await table.wait(i, after, long_poll_timeout)
+        return response("200 OK", {"player": table.players[i], "messages": messages,
+                                   "next": after + len(messages),
+                                   "revealed": table.revealed_at is not None})
+    return response("404 Not Found", {"error": "not found"})
+
+async def handle(reader, writer):
+    try:
+        request = await read_request(reader)
+        if request is not None:
+            data = await route(*request, writer)
+            if data is not None:
+                writer.write(data)
+                await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass #the client went away
+    except ValueError:
+        writer.write(response("400 Bad Request", {"error": "bad request"}))
+    finally:
+        writer.close()
+
+async def serve(host="127.0.0.1", port=8000):
+    server = await asyncio.start_server(handle, host, port)
+    cleaner = asyncio.create_task(clean_up())
+    async with server:
+        await server.serve_forever()
+    cleaner.cancel()
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    asyncio.run(serve(port=port))
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import glob
+import numpy as np
+import batch
+
+"""
+Usage: `python sink.py player1,...,playerN role1,...,roleM directory nights [batch_size]`
+
+Streams the outcomes of many nights of one setup to disk, in bounded memory.
+
+Each night is one fixed-width record, with the same arrays as batch.BatchResult:
+
+    initial   card id dealt to each player and center location
+    final     card id at each player and center location at the end of the night
+    wolf_card card id on the wolf-card at the end of the night
+    shielded, revealed, marked (index into onuw.marks, or -1) for each player
+    copied    role id copied by each card (PI, medium, doppelganger), or -1
+    action    role id whose action each player did, or -1. Only roles whose actions
+              batch.py resolves count, so e.g. a seer's is always -1
+    targets   up to two locations (as in initial and final) each player's action was
+              done to, in order, or -1
+    doppelganged  the player each doppelganger copied, or -1
+
+Records are written in chunks, as numpy .npy files of a structured dtype, so that
+analysis can np.load(path, mmap_mode="r") them without parsing anything. meta.json
+in the same directory names the players and the role of each card id.
+"""
+
+def record_dtype(N):
+    M = N + 3
+    return np.dtype([
+        ("initial", np.int16, (M,)),
+        ("final", np.int16, (M,)),
+        ("wolf_card", np.int16),
+        ("shielded", np.bool_, (N,)),
+        ("revealed", np.bool_, (N,)),
+        ("marked", np.int8, (N,)),
+        ("copied", np.int16, (M + 1,)),
+        ("action", np.int16, (N,)),
+        ("targets", np.int16, (N, 2)),
+        ("doppelganged", np.int16, (N,)),
+    ])
+
+#collects BatchResults and writes them out as chunks of chunk_size records
+#unless append is set, chunks already in directory are replaced
+class ResultSink():
+    def __init__(self, directory, players, roles, chunk_size=1 << 17, append=False):
+        self.directory = directory
+        self.players = players
+        self.cards = list(roles) + ["werewolf"]
+        self.dtype = record_dtype(len(players))
+        self.chunk_size = chunk_size
+        self.buffer = np.empty(chunk_size, dtype=self.dtype)
+        self.filled = 0
+        os.makedirs(directory, exist_ok=True)
+        if not append:
+            for path in chunk_paths(directory):
+                os.remove(path)
+        self.chunks = len(chunk_paths(directory))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"players": players, "cards": self.cards, "chunk_size": chunk_size}, f)
+
+    def write(self, result):
+        assert result.cards == self.cards, (result.cards, self.cards)
+        start = 0
+        while start < len(result):
+            n = min(len(result) - start, self.chunk_size - self.filled)
+            rows = slice(start, start + n)
+            out = self.buffer[self.filled:self.filled + n]
+            out["initial"] = result.initial[rows]
+            out["final"] = result.final[rows]
+            out["wolf_card"] = result.wolf_card[rows]
+            out["shielded"] = result.shielded[rows]
+            out["revealed"] = result.revealed[rows]
+            out["marked"] = result.marked[rows]
+            out["copied"] = result.copied[rows]
+            out["action"] = result.action[rows]
+            out["targets"] = result.targets[rows]
+            out["doppelganged"] = result.doppelganged[rows]
+            self.filled += n
+            start += n
+            if self.filled == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if not self.filled:
+            return
+        path = os.path.join(self.directory, f"chunk-{self.chunks:06d}.npy")
+        #write to a temporary file first, so that readers never see half a chunk
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, self.buffer[:self.filled])
+        os.replace(path + ".tmp", path)
+        self.chunks += 1
+        self.filled = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def chunk_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "chunk-*.npy")))
+
+#the chunks in directory, as memory-mapped record arrays
+def load_chunks(directory):
+    return [np.load(path, mmap_mode="r") for path in chunk_paths(directory)]
+
+def load_meta(directory):
+    with open(os.path.join(directory, "meta.json")) as f:
+        return json.load(f)
+
+#simulates nights of one setup batch_size at a time, writing each batch to directory
+def stream_nights(players, roles, nights, directory, batch_size=100000, lonewolf=True,
+                  rng=None, chunk_size=1 << 17):
+    rng = np.random.default_rng(rng)
+    with ResultSink(directory, players, roles, chunk_size) as sink:
+        done = 0
+        while done < nights:
+            games = min(batch_size, nights - done)
+            sink.write(batch.simulate_batch(players, roles, games, lonewolf, rng))
+            done += games
+
+if __name__ == '__main__':
+    players = sys.argv[1].split(",")
+    roles = sys.argv[2].split(",")
+    directory = sys.argv[3]
+    nights = int(sys.argv[4])
+    batch_size = int(sys.argv[5]) if len(sys.argv) > 5 else 100000
+    stream_nights(players, roles, nights, directory, batch_size)
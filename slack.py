@@ -1,6 +1,11 @@
-from slackclient import SlackClient
-from slack_token import slack_token
 import os
+import json
+import time
+import queue
+import threading
+import http.client
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
 
 """
   Instructions:
@@ -9,29 +14,259 @@ import os
   Create a new file slack_token.py in this directory, with the single line `slack_token = "..."`
 """
 
+#where the workspace's user directory is cached between games, and for how long
+user_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".slack_users.json")
+user_cache_ttl = 24 * 60 * 60
+#don't refetch the directory for unknown names more often than this
+user_refresh_interval = 10 * 60
+
+#(calls per second, burst size) for each api method, from slack's published rate limit tiers
+rate_limits = {
+    "users.list": (20 / 60, 5),
+    "conversations.open": (50 / 60, 20),
+    "chat.postMessage": (1, 20),
+}
+default_rate_limit = (50 / 60, 20)
+#methods whose limit is for each channel, rather than for the whole workspace
+per_channel_limits = {"chat.postMessage"}
+
+#calls that change nothing if they are made twice, so they can be retried whatever went wrong
+idempotent_methods = {"users.list", "conversations.open"}
+
+#how many messages are sent at the same time
+delivery_threads = 8
+
+#a request that failed before it was sent, so it can't have reached slack
+class NotSent(ConnectionError):
+    pass
+
+#blocks until a call is allowed, so that a burst of calls doesn't get rate limited
+class TokenBucket():
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.time) * self.rate)
+            self.time = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+#a small client for the slack web api, which keeps its connections open between calls,
+#stays under the rate limits, and retries calls that were rate limited anyway
+#rate_limited=False skips the waiting, e.g. against a local mock of slack
+class SlackClient():
+    def __init__(self, token, host="slack.com", port=None, https=True, pool_size=8, max_retries=5,
+                 rate_limited=True):
+        self.token = token
+        self.host = host
+        self.port = port
+        self.https = https
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        self.max_retries = max_retries
+        self.rate_limited = rate_limited
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.retries = 0
+
+    def bucket(self, method, channel=None):
+        key = (method, channel)
+        with self.buckets_lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*rate_limits.get(method, default_rate_limit))
+            return self.buckets[key]
+
+    def connect(self):
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=30)
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    #closes every idle connection, e.g. after the server timed them out while the game was idle
+    def close_pool(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def request(self, method, params, fresh=False):
+        body = urlencode({k: format_param(v) for k, v in params.items()})
+        headers = {"Authorization": f"Bearer {self.token}",
+                   "Content-Type": "application/x-www-form-urlencoded"}
+        try:
+            conn = self.connect() if fresh else self.pool.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            conn.request("POST", f"/api/{method}", body, headers)
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            raise NotSent(str(e)) from e
+        try:
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            raise
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return response, data
+
+    def api_call(self, method, **params):
+        channel = params.get("channel") if method in per_channel_limits else None
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limited:
+                self.bucket(method, channel).take()
+            try:
+                response, data = self.request(method, params)
+            except (http.client.HTTPException, OSError) as e:
+                #e.g. a message whose reply timed out may have been posted, so it isn't sent again
+                if not isinstance(e, NotSent) and method not in idempotent_methods:
+                    raise
+                #the server may have closed the pooled connections, so try once more on a fresh one
+                self.close_pool()
+                response, data = self.request(method, params, fresh=True)
+            if response.status != 429 or attempt == self.max_retries:
+                return json.loads(data)
+            self.retries += 1
+            time.sleep(float(response.getheader("Retry-After") or 1))
+
+def format_param(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return ",".join(value)
+    return value
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from slack_token import slack_token
+            _client = SlackClient(slack_token)
+        return _client
+
+#points the client somewhere other than slack.com, e.g. configure("127.0.0.1", 8080, https=False)
+#for a local mock of the slack api. Other options are passed on to SlackClient
+def configure(host="slack.com", port=None, https=True, token=None, **options):
+    global _client
+    if token is None:
+        from slack_token import slack_token as token
+    with _client_lock:
+        _client = SlackClient(token, host, port, https, **options)
+    _dm_channels.clear()
+
+#cache of conversations.open, keyed by the sorted user ids in the conversation
+_dm_channels = {}
+
+def dm_channel(slack_ids):
+    key = tuple(sorted(slack_ids))
+    if key not in _dm_channels:
+        _dm_channels[key] = get_client().api_call(
+            "conversations.open",
+            users=list(key))['channel']['id']
+    return _dm_channels[key]
+
+def fetch_users():
+    members = []
+    cursor = None
+    while True:
+        params = {"limit": 200}
+        if cursor:
+            params["cursor"] = cursor
+        result = get_client().api_call("users.list", **params)
+        members.extend({"id": x["id"], "name": x["name"],
+                        "profile": {"display_name": x["profile"].get("display_name", ""),
+                                    "real_name": x["profile"].get("real_name", "")}}
+                       for x in result["members"])
+        cursor = result.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return members
+
+#uppercased first names that a player can use to refer to this user
+def user_keys(user):
+    return {x.split()[0].split('.')[0].upper() if x else ''
+            for x in [user['name'], user['profile']['display_name'], user['profile']['real_name']]}
+
+_user_index = None
+_user_index_time = 0
+
+#map from each of user_keys to the ids of matching users, in the order slack lists them
+def user_index(refresh=False):
+    global _user_index, _user_index_time
+    now = time.time()
+    if not refresh and _user_index is not None and now - _user_index_time < user_cache_ttl:
+        return _user_index
+    members = None
+    if not refresh and os.path.exists(user_cache_path):
+        with open(user_cache_path) as f:
+            cached = json.load(f)
+        if now - cached["time"] < user_cache_ttl:
+            members, _user_index_time = cached["members"], cached["time"]
+    if members is None:
+        members, _user_index_time = fetch_users(), now
+        with open(user_cache_path, "w") as f:
+            json.dump({"time": now, "members": members}, f)
+    index = {}
+    for user in members:
+        for key in user_keys(user):
+            index.setdefault(key, []).append(user['id'])
+    _user_index = index
+    return index
+
 def get_slack_ids(usernames):
-    client = SlackClient(slack_token)
-    users_info = client.api_call("users.list")['members']
-    def users_by_name(name):
-        return [x['id'] for x in users_info if matches(name, x)]
-    by_name = [(name, users_by_name(name)) for name in usernames]
+    index = user_index()
+    missing = [name for name in usernames if name.upper() not in index]
+    if missing and time.time() - _user_index_time > user_refresh_interval:
+        #someone may have joined the workspace since the directory was cached
+        index = user_index(refresh=True)
+    by_name = [(name, index.get(name.upper(), [])) for name in usernames]
     return {name: ids[0] for name, ids in by_name if ids}
 
 def post_message(slack_ids, text):
     if isinstance(slack_ids, str):
         slack_ids = [slack_ids]
-    client = SlackClient(slack_token)
-    channel = client.api_call(
-        "conversations.open",
-        users=slack_ids)['channel']['id']
-    result = client.api_call(
+    channel = dm_channel(slack_ids)
+    result = get_client().api_call(
        "chat.postMessage",
        channel=channel, text=text, as_user=False,
        username='onuw-bot',
        icon_emoji='robot')
     if 'error' in result:
         print(f'Error slacking: {result}')
+    return result
+
+_executor = None
+
+#send many messages at once, as a list of (slack_ids, text)
+#returns the seconds each message took to be delivered, in the same order, or None for
+#a message that couldn't be delivered, so that one failure doesn't stop the others
+def post_messages(messages):
+    global _executor
+    with _client_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(delivery_threads, thread_name_prefix="slack")
+    start = time.monotonic()
+    def deliver(message):
+        try:
+            result = post_message(*message)
+        except (http.client.HTTPException, OSError, KeyError, ValueError) as e:
+            print(f'Error slacking {message[0]}: {e!r}')
+            return None
+        return time.monotonic() - start if result.get("ok", True) else None
+    return list(_executor.map(deliver, messages))
 
 def matches(name, user):
-    return name.upper() in {x.split()[0].split('.')[0].upper() if x else ''
-                            for x in [user['name'], user['profile']['display_name'], user['profile']['real_name']]}
+    return name.upper() in user_keys(user)
@@ -0,0 +1,140 @@
+import sys
+import json
+import os
+import zlib
+import multiprocessing
+from itertools import islice
+import numpy as np
+from onuw import valid_roles, all_wolves_mask, seen_as_wolves_mask
+import batch
+import sink
+import scoring
+
+"""
+Usage: `python sweep.py players role1,role2,...,roleK checkpoint.jsonl [games] [records]`
+
+Simulates every setup of players+3 roles drawn from the pool (with up to max_copies
+copies of each role), spread over all cores, and appends one line of statistics per
+setup to the checkpoint file. Setups already in the checkpoint are skipped, so an
+interrupted sweep can be restarted with the same command.
+
+Setups with two doppelgangers are resolved one night at a time (see batch.py), about 30
+times slower than the rest, so with the doppelganger in the pool and max_copies of 2 they
+can take most of the sweep's time.
+
+If a records directory is given, every night of each setup is also written there, in
+records/<setup>/, as chunks of fixed-width records (see sink.py).
+"""
+
+#every sorted setup of N+3 roles from pool, one at a time, in order
+def setups(pool, N, max_copies=2):
+    roles = sorted(set(pool))
+    def extend(k, left):
+        if left == 0:
+            yield ()
+            return
+        if k == len(roles):
+            return
+        for copies in range(min(max_copies, left), -1, -1):
+            for rest in extend(k + 1, left - copies):
+                yield (roles[k],) * copies + rest
+    return extend(0, N + 3)
+
+#how many setups there are, without listing them
+def count_setups(pool, N, max_copies=2):
+    counts = [1] + [0] * (N + 3) #counts[n] is the number of setups of n roles so far
+    for _ in set(pool):
+        counts = [sum(counts[n - copies] for copies in range(min(max_copies, n) + 1))
+                  for n in range(N + 4)]
+    return counts[N + 3]
+
+def setup_key(setup):
+    return ",".join(setup)
+
+def setup_stats(N, setup, games, records=None, seed=0):
+    players = [f"player{i}" for i in range(N)]
+    #each setup gets its own stream, from the sweep's seed and the setup, so that the numbers
+    #don't depend on which worker ran it, and rerunning a setup gives the same numbers
+    rng = np.random.default_rng([seed, zlib.crc32(setup_key(setup).encode())])
+    result = batch.simulate_batch(players, list(setup), games, rng=rng)
+    if records is not None:
+        with sink.ResultSink(os.path.join(records, setup_key(setup)), players, list(setup)) as out:
+            out.write(result)
+    initial = result.initial_roles()
+    final = result.final_roles()
+    wolves = batch.in_category(final, all_wolves_mask)
+    seen_wolves = batch.in_category(initial[:, :N], seen_as_wolves_mask).sum(axis=1)
+    #there's no model of how people vote, so score every game with random votes
+    scored = scoring.final_role_ids(result)
+    team = scoring.role_teams[scored]
+    votes = scoring.random_votes(games, N, rng)
+    wins = scoring.score_batch(scored, votes, result.marked)
+    def win_rate(t):
+        return float(wins[team == t].mean()) if (team == t).any() else None
+    return {
+        "setup": setup_key(setup),
+        "players": N,
+        "games": games,
+        #fraction of games that end with at least one wolf in the center
+        "center_wolf_rate": float(wolves[:, N:].any(axis=1).mean()),
+        "player_wolves": float(wolves[:, :N].sum(axis=1).mean()),
+        #average number of players who end the night with a different card than they started with
+        "swaps": float((result.initial[:, :N] != result.final[:, :N]).sum(axis=1).mean()),
+        "lone_wolf_rate": float((seen_wolves == 1).mean()),
+        "no_wolf_rate": float((seen_wolves == 0).mean()),
+        "shield_rate": float(result.shielded.any(axis=1).mean()),
+        #fraction of players on each team (by final role, before marks) who win, under random votes
+        "village_win_rate": win_rate(scoring.village),
+        "werewolf_win_rate": win_rate(scoring.werewolf),
+        "tanner_win_rate": win_rate(scoring.tanner),
+    }
+
+def _setup_stats(args):
+    return setup_stats(*args)
+
+def load_checkpoint(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = f.readlines()
+        for line in lines:
+            try:
+                done.add(json.loads(line)["setup"])
+            except ValueError:
+                pass #a line cut off by an interruption, that setup will be redone
+        if lines and not lines[-1].endswith("\n"):
+            with open(path, "a") as f:
+                f.write("\n")
+    return done
+
+#how many setups are handed to the workers at once
+sweep_chunk_size = 1000
+
+def sweep(N, pool, checkpoint, games=10000, max_copies=2, processes=None, records=None, seed=0):
+    assert all(role in valid_roles for role in pool), pool
+    done = load_checkpoint(checkpoint)
+    print(f"{len(done)} setups already done, of {count_setups(pool, N, max_copies)}")
+    #there can be far too many setups to list, and imap_unordered reads all of its input
+    #straight away, so the setups are generated and handed out a chunk at a time
+    todo = ((N, setup, games, records, seed) for setup in setups(pool, N, max_copies)
+            if setup_key(setup) not in done)
+    k = 0
+    with multiprocessing.Pool(processes) as workers, open(checkpoint, "a") as f:
+        while True:
+            chunk = list(islice(todo, sweep_chunk_size))
+            if not chunk:
+                break
+            for stats in workers.imap_unordered(_setup_stats, chunk, chunksize=4):
+                f.write(json.dumps(stats) + "\n")
+                f.flush()
+                k += 1
+                if k % 100 == 0:
+                    print(f"{k} more done")
+
+if __name__ == '__main__':
+    N = int(sys.argv[1])
+    pool = sys.argv[2].split(",")
+    checkpoint = sys.argv[3]
+    games = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
+    records = sys.argv[5] if len(sys.argv) > 5 else None
+    sweep(N, pool, checkpoint, games, records=records)